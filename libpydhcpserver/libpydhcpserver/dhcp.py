@@ -25,10 +25,16 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 (C) Mathieu Ignacio, 2008 <mignacio@april.org>
 """
 import collections
+import errno
 import platform
-import select
+import queue
+import selectors
 import socket
+import struct
 import threading
+import time
+import traceback
+import warnings
 
 from .dhcp_types.ipv4 import IPv4
 from .dhcp_types.mac import MAC
@@ -41,6 +47,7 @@ from .dhcp_types.constants import (
 _IP_GLOB = IPv4('0.0.0.0') #: The internal "everything" address.
 _IP_BROADCAST = IPv4('255.255.255.255') #: The broadcast address.
 IP_UNSPECIFIED_FILTER = (_IP_GLOB, _IP_BROADCAST, None) #: A tuple of addresses that reflect non-unicast targets.
+_IP_UNSPECIFIED = frozenset(IP_UNSPECIFIED_FILTER) #: `IP_UNSPECIFIED_FILTER`, for constant-time membership tests.
 
 _ETH_P_SNAP = 0x0005
 """
@@ -65,12 +72,37 @@ if platform.system() == 'Linux':
 else: #Assume BSD/OS X
    _SO_BINDTODEVICE = 20 #IP_RECVIF as defined in FreeBSD
 
-_AF_PACKET = (hasattr(socket, 'AF_PACKET') and socket.AF_PACKET) or 17
+_AF_PACKET = getattr(socket, 'AF_PACKET', 17)
 """
 Linux constant for AF_PACKET, just in case Python wasn't built against complete
 headers.
 """
 
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', None)
+"""
+The flag for a single non-blocking read; without it, only one packet is read per
+wake-up.
+"""
+
+_DRAIN_LIMIT = 64
+"""
+The most packets to read from a socket per wake-up, so that a flooded socket
+can't keep the other from being serviced.
+"""
+
+_RECEIVE_BUFFER_SIZE = 2 ** 20
+"""
+The receive-buffer size requested for the listening sockets, so that a burst
+of requests, like a rack booting at once, queues rather than being dropped;
+the kernel may cap this.
+"""
+
+_DROP_REPORT_INTERVAL = 60.0
+"""
+The minimum number of seconds between reports of packets discarded because
+every worker was busy, so that an overload doesn't also flood the logs.
+"""
+
 Address = collections.namedtuple("Address", ('ip', 'port'))
 """
 An inet layer-3 address.
@@ -90,8 +122,13 @@ class DHCPServer(object):
     """
     _server_address = None #: The IP associated with this server.
     _network_link = None #: The I/O-handler; you don't want to touch this.
+    _work_queue = None #: Received packets, with their handlers, waiting for a worker.
+    _workers = None #: The threads that process received packets.
+    _handlers = None #: The handlers this server implements, keyed by DHCP message-type.
+    _dropped_packets = 0 #: The number of packets discarded under load since the last report.
+    _dropped_report_time = 0.0 #: The monotonic time before which no further drop-report is made.
 
-    def __init__(self, server_address, server_port, client_port, proxy_port=None, response_interface=None, response_interface_qtags=None, link_local_only=False):
+    def __init__(self, server_address, server_port, client_port, proxy_port=None, response_interface=None, response_interface_qtags=None, link_local_only=False, worker_count=16, queue_size=256):
         """
         Sets up the DHCP network infrastructure.
 
@@ -108,6 +145,10 @@ class DHCPServer(object):
             order of appearance. Definitions take the following form:
             (pcp:`0-7`, dei:``bool``, vid:`1-4094`)
         :param bool link_local_only: Whether system-level routing should be disabled (never desired when relays are enabled).
+        :param int worker_count: The number of threads that process packets
+            concurrently; packets that arrive while all are busy wait their turn.
+        :param int queue_size: The number of packets that may wait for a
+            worker; packets that arrive while the queue is full are discarded.
         :except Exception: A problem occurred during setup.
         """
         self._server_address = server_address
@@ -116,10 +157,131 @@ class DHCPServer(object):
             response_interface = getifaddrslib.get_network_interface(server_address)
         self._network_link = _NetworkLink(str(server_address), server_port, client_port, proxy_port, response_interface, response_interface_qtags=response_interface_qtags, link_local_only=link_local_only)
 
+        #Only queue packets if there's an implementation to handle them
+        self._handlers = {}
+        for (message_type, handler, default) in (
+            (3, self._handleDHCPRequest, DHCPServer._handleDHCPRequest),
+            (1, self._handleDHCPDiscover, DHCPServer._handleDHCPDiscover),
+            (8, self._handleDHCPInform, DHCPServer._handleDHCPInform),
+            (7, self._handleDHCPRelease, DHCPServer._handleDHCPRelease),
+            (4, self._handleDHCPDecline, DHCPServer._handleDHCPDecline),
+            (10, self._handleDHCPLeaseQuery, DHCPServer._handleDHCPLeaseQuery),
+        ):
+            if handler.__func__ is not default:
+                self._handlers[message_type] = handler
+                
+        self._work_queue = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        for i in range(worker_count):
+            worker = threading.Thread(target=self._processPackets, name="DHCP-worker-{}".format(i))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _processPackets(self):
+        """
+        Handles queued packets until `shutdown()` is called; run by each worker
+        thread.
+        """
+        while True:
+            work = self._work_queue.get()
+            if work is None: #Shutting down
+                return
+            (handler, packet, source_address, port) = work
+            try:
+                handler(packet, source_address, port)
+            except Exception:
+                self._handleProcessingError(packet, source_address, port)
+
+    def _handleProcessingError(self, packet, source_address, port):
+        """
+        Reports an exception that escaped a packet-handler; called from within
+        the ``except`` block, so the exception is still current.
+
+        Override this to route the failure through your own logging; by
+        default, a warning is raised.
+
+        :param packet: The packet that was being processed.
+        :type packet: :class:`DHCPPacket <dhcp_types.packet.DHCPPacket>`
+        :param source_address: The address from which the request was received.
+        :type source_address: :class:`Address <dhcp.Address>`
+        :param int port: The port on which the packet was received.
+        """
+        warnings.warn('Unhandled exception while processing packet from {}:\n{}'.format(
+            source_address, traceback.format_exc(),
+        ))
+
+    def _countDroppedPacket(self):
+        """
+        Records that a packet was discarded under load, indicating whether a
+        report is due; only ever called from the listening thread.
+
+        :return int: The number of packets discarded since the last report, if
+                     another should be made now, or 0.
+        """
+        self._dropped_packets += 1
+        now = time.monotonic()
+        if now < self._dropped_report_time:
+            return 0
+        self._dropped_report_time = now + _DROP_REPORT_INTERVAL
+        (dropped, self._dropped_packets) = (self._dropped_packets, 0)
+        return dropped
+
+    def _handlePacketDropped(self, packet, source_address, port):
+        """
+        Reports a packet that was discarded because every worker was busy and
+        the queue was full.
+
+        Override this to route the event through your own logging or
+        statistics; by default, a warning is raised at most once every
+        `_DROP_REPORT_INTERVAL` seconds.
+
+        :param packet: The packet that was discarded.
+        :type packet: :class:`DHCPPacket <dhcp_types.packet.DHCPPacket>`
+        :param source_address: The address from which the request was received.
+        :type source_address: :class:`Address <dhcp.Address>`
+        :param int port: The port on which the packet was received.
+        """
+        dropped = self._countDroppedPacket()
+        if dropped:
+            warnings.warn('Work queue full; discarded {} packet(s) since the last report'.format(dropped))
+
+    def shutdown(self, timeout=None):
+        """
+        Stops the worker threads once they have finished processing every
+        packet already queued, waiting for them to exit.
+        
+        :param float timeout: The number of seconds to wait, in total, for the
+                              workers to exit; None to wait indefinitely.
+                              Workers that are still busy when it expires are
+                              abandoned, which is safe since they are daemonic.
+        :return list: The names of any workers that were still running.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        def remaining():
+            if deadline is None:
+                return None
+            return max(0, deadline - time.monotonic())
+            
+        try:
+            for worker in self._workers:
+                self._work_queue.put(None, timeout=remaining())
+        except queue.Full: #Workers are stuck and the queue is backed up
+            pass
+        for worker in self._workers:
+            worker.join(remaining())
+        busy = [worker.name for worker in self._workers if worker.is_alive()]
+        self._workers = []
+        return busy
+        
     def _getNextDHCPPacket(self, timeout=60, packet_buffer=2048):
         """
         Blocks for up to ``timeout`` seconds while waiting for a packet to
-        arrive; if one does, a thread is spawned to process it.
+        arrive; if one does, it is queued for a worker thread to process,
+        unless too many packets are already waiting, in which case it is
+        discarded and reported through `_handlePacketDropped()`.
 
         Have a thread blocking on this at all times; restart it immediately after it returns.
 
@@ -131,29 +293,18 @@ class DHCPServer(object):
         """
         (source_address, data, port) = self._network_link.getData(timeout=timeout, packet_buffer=packet_buffer)
         if data:
-            try:
-                packet = DHCPPacket(data=data)
-            except ValueError:
-                pass
-            else:
-                if packet.isDHCPRequestPacket():
-                    if self._handleDHCPRequest.__func__ is not DHCPServer._handleDHCPRequest: #only spawn a thread if there's an implementation to handle the packet
-                        threading.Thread(target=self._handleDHCPRequest, args=(packet, source_address, port)).start()
-                elif packet.isDHCPDiscoverPacket():
-                    if self._handleDHCPDiscover.__func__ is not DHCPServer._handleDHCPDiscover:
-                        threading.Thread(target=self._handleDHCPDiscover, args=(packet, source_address, port)).start()
-                elif packet.isDHCPInformPacket():
-                    if self._handleDHCPInform.__func__ is not DHCPServer._handleDHCPInform:
-                        threading.Thread(target=self._handleDHCPInform, args=(packet, source_address, port)).start()
-                elif packet.isDHCPReleasePacket():
-                    if self._handleDHCPRelease.__func__ is not DHCPServer._handleDHCPRelease:
-                        threading.Thread(target=self._handleDHCPRelease, args=(packet, source_address, port)).start()
-                elif packet.isDHCPDeclinePacket():
-                    if self._handleDHCPDecline.__func__ is not DHCPServer._handleDHCPDecline:
-                        threading.Thread(target=self._handleDHCPDecline, args=(packet, source_address, port)).start()
-                elif packet.isDHCPLeaseQueryPacket():
-                    if self._handleDHCPLeaseQuery.__func__ is not DHCPServer._handleDHCPLeaseQuery:
-                        threading.Thread(target=self._handleDHCPLeaseQuery, args=(packet, source_address, port)).start()
+            message_type = DHCPPacket.peekDHCPMessageType(data)
+            if message_type is not None:
+                handler = self._handlers.get(message_type)
+                if handler: #Only packets that will be handled are decoded
+                    try:
+                        packet = DHCPPacket(data=data)
+                    except ValueError:
+                        return (False, source_address)
+                    try:
+                        self._work_queue.put_nowait((handler, packet, source_address, port))
+                    except queue.Full: #Clients retransmit, so shedding load is safe
+                        self._handlePacketDropped(packet, source_address, port)
                 return (True, source_address)
         return (False, source_address)
 
@@ -267,6 +418,8 @@ class _NetworkLink(object):
     _responder_proxy = None #: The internal socket to use for responding to ProxyDHCP requests.
     _responder_broadcast = None #: The internal socket to use for responding to broadcast requests.
     _listening_sockets = None #: All sockets on which to listen for activity.
+    _selector = None #: Watches the listening sockets, each registered with the port it serves.
+    _received = None #: Packets read after a wake-up that are still to be provided, with their ports.
     _unicast_discover_supported = False #: Whether unicast responses to DISCOVERs are supported.
 
     def __init__(self, server_address, server_port, client_port, proxy_port, response_interface=None, response_interface_qtags=None, link_local_only=False):
@@ -297,6 +450,12 @@ class _NetworkLink(object):
             self._proxy_socket = proxy_socket
         else:
             self._listening_sockets = (dhcp_socket,)
+        #Registration persists, so each wait doesn't need to describe the sockets anew
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(dhcp_socket, selectors.EVENT_READ, server_port)
+        if proxy_socket:
+            self._selector.register(proxy_socket, selectors.EVENT_READ, proxy_port)
+        self._received = collections.deque()
 
         #Wrap the sockets with appropriate logic and set options
         self._responder_dhcp = _L3Responder(socketobj=dhcp_socket)
@@ -309,7 +468,6 @@ class _NetworkLink(object):
                 try:
                     self._responder_broadcast = _L2Responder_pcap(server_address, response_interface, qtags=response_interface_qtags)
                 except Exception as e:
-                    import errno
                     raise EnvironmentError(errno.ELIBACC, "Raw response-socket requested on {interface}, but neither AF_PACKET nor libpcap are available, or the interface does not exist".format(
                         interface=response_interface,
                     ))
@@ -342,7 +500,6 @@ class _NetworkLink(object):
             if proxy_socket:
                 proxy_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         except socket.error as e:
-            import warnings
             warnings.warn('Unable to set SO_REUSEADDR; multiple DHCP servers cannot be run in parallel: {}'.format(e))
 
         if platform.system() != 'Linux':
@@ -351,9 +508,15 @@ class _NetworkLink(object):
                 if proxy_port:
                     proxy_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             except socket.error as e:
-                import warnings
                 warnings.warn('Unable to set SO_REUSEPORT; multiple DHCP servers cannot be run in parallel: {}'.format(e))
 
+        try:
+            dhcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RECEIVE_BUFFER_SIZE)
+            if proxy_socket:
+                proxy_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RECEIVE_BUFFER_SIZE)
+        except socket.error as e:
+            warnings.warn('Unable to set SO_RCVBUF; bursts of requests may be dropped: {}'.format(e))
+
         try:
             dhcp_socket.bind(('', server_port))
             if proxy_port:
@@ -379,7 +542,11 @@ class _NetworkLink(object):
 
     def getData(self, timeout, packet_buffer):
         """
-        Runs `select()` over all relevant sockets, providing data if available.
+        Waits for activity on all relevant sockets, providing data if available.
+
+        Every socket that wakes is read until it has nothing more to offer, with
+        the packets provided by subsequent calls before waiting again, so a
+        busy server doesn't need a wait for every packet.
 
         :param int timeout: The number of seconds to wait before returning.
         :param int packet_buffer: The size of the buffer to use for receiving packets.
@@ -387,19 +554,25 @@ class _NetworkLink(object):
             0. :class:`Address <dhcp.Address>` or ``None``: None if the timeout was reached.
             1. The received data as a ``str`` or ``None`` if the timeout was reached.
             2. the port on which the packet was received; -1 on timeout or error. 
-        :except select.error: The `select()` operation did not complete gracefully.
-        """
-        port = -1
-        active_sockets = select.select(self._listening_sockets, [], [], timeout)[0]
-        if active_sockets:
-            active_socket = active_sockets[0]
-            if active_socket == self._proxy_socket:
-                port = self._proxy_port
-            else:
-                port = self._server_port
-            (data, source_address) = active_socket.recvfrom(packet_buffer)
-            if data:
-                return (Address(IPv4(source_address[0]), source_address[1]), data, port)
+        :except select.error: The wait did not complete gracefully.
+        """
+        received = self._received
+        if not received:
+            for (key, mask) in self._selector.select(timeout):
+                active_socket = key.fileobj
+                received.append(active_socket.recvfrom(packet_buffer) + (key.data,))
+                if _MSG_DONTWAIT:
+                    for i in range(_DRAIN_LIMIT - 1):
+                        try:
+                            received.append(active_socket.recvfrom(packet_buffer, _MSG_DONTWAIT) + (key.data,))
+                        except BlockingIOError:
+                            break
+            if not received:
+                return (None, None, -1)
+
+        (data, source_address, port) = received.popleft()
+        if data:
+            return (Address(IPv4(source_address[0]), source_address[1]), data, port)
         return (None, None, port)
 
     def sendData(self, packet, address, port):
@@ -421,7 +594,7 @@ class _NetworkLink(object):
         port = self._client_port
         source_port = self._server_port
         responder = self._responder_dhcp
-        if address.ip in IP_UNSPECIFIED_FILTER: #Broadcast source; this is never valid for ProxyDHCP
+        if address.ip in _IP_UNSPECIFIED: #Broadcast source; this is never valid for ProxyDHCP
             if (not self._unicast_discover_supported #All responses have to be via broadcast
                 or packet.getFlag(FLAGBIT_BROADCAST)): #Broadcast bit set; respond in kind
                 ip = _IP_BROADCAST
@@ -465,9 +638,9 @@ class _Responder(object):
         :except Exception: An error occurred during serialisation or transmission.
         """
         if relayed:
-            broadcast_source = packet.extractIPOrNone(FIELD_CIADDR) in IP_UNSPECIFIED_FILTER
+            broadcast_source = packet.extractIPOrNone(FIELD_CIADDR) in _IP_UNSPECIFIED
         else:
-            broadcast_source = ip in IP_UNSPECIFIED_FILTER
+            broadcast_source = ip in _IP_UNSPECIFIED
         (broadcast_changed, original_was_broadcast) = packet.setFlag(FLAGBIT_BROADCAST, broadcast_source)
 
         #Perform any necessary packet-specific address-changes
@@ -477,10 +650,13 @@ class _Responder(object):
         if packet.response_source_port is not None:
             kwargs['source_port'] = packet.response_source_port
 
+        #Resolve the address once, so its rendering is cached and reused below
+        if not isinstance(ip, IPv4):
+            ip = IPv4(ip)
         bytes_sent = self._send(packet, str(ip), port, **kwargs)
         if broadcast_changed: #Restore the broadcast bit, in case the packet needs to be used for something else
             packet.setFlag(FLAGBIT_BROADCAST, original_was_broadcast)
-        return (bytes_sent, Address(IPv4(ip), port))
+        return (bytes_sent, Address(ip, port))
 
     def _send(self, packet, ip, port, **kwargs):
         """
@@ -546,10 +722,12 @@ class _L2Responder(_Responder):
     """
     _ethernet_id = None #: The source MAC and Ethernet payload-type (and qtags, if applicable).
     _server_address = None #: The server's IP.
+    _headers = None #: A `struct.Struct` covering the Ethernet, IPv4, and UDP headers.
+    _ip_offset = None #: The position of the IPv4 header within a frame.
+    _udp_pseudo_sum = None #: The constant part of the UDP pseudo-header, summed.
 
     #Locally cached module functions
-    _array_ = None #: `array.array`
-    _pack_ = None #: `struct.pack`
+    _pack_into_ = None #: `struct.pack_into`
 
     def __init__(self, server_address, mac, qtags=None):
         """
@@ -560,10 +738,7 @@ class _L2Responder(_Responder):
         :param sequence qtags: Any qtags to insert into raw packets, in order of appearance.
             Definitions take the following form: (pcp:`0-7`, dei:``bool``, vid:`1-4094`)
         """
-        import struct
-        self._pack_ = struct.pack
-        import array
-        self._array_ = array.array
+        self._pack_into_ = struct.pack_into
 
         self._server_address = socket.inet_aton(str(server_address))
         ethernet_id = [mac,] #Source MAC
@@ -573,68 +748,71 @@ class _L2Responder(_Responder):
                 qtag_value = pcp << 13 #Priority-code-point (0-7)
                 qtag_value += int(dei) << 12 #Drop-eligible-indicator
                 qtag_value += vid #vlan-identifier
-                ethernet_id.append(self._pack('!H', qtag_value))
+                ethernet_id.append(struct.pack('!H', qtag_value))
         ethernet_id.append(b'\x08\x00') #IP payload-type
         self._ethernet_id = b''.join(ethernet_id)
 
-    def _checksum(self, data):
+        self._headers = struct.Struct('!6s{}s BBHHHBBH4s4s HHHH'.format(len(self._ethernet_id)))
+        self._ip_offset = 6 + len(self._ethernet_id)
+        #The source address and protocol never change, and word-aligned parts
+        #of the sum can be added in any order, so they're summed only once
+        self._udp_pseudo_sum = int.from_bytes(self._server_address + b'\0\x11', 'big') % 0xffff
+
+    def _checksum(self, data, partial_sum=0):
         """
         Computes the RFC768 checksum of ``data``.
 
+        Because 2**16 is congruent to 1 modulo 0xffff, the ones'-complement sum
+        of the data's 16-bit words is the remainder of the data, read as one
+        big-endian integer, divided by 0xffff, so the whole sum is a single
+        C-level operation, independent of the host's byte-order.
+
         :param sequence data: The data to be checksummed.
-        :return int: The data's checksum.
+        :param int partial_sum: The sum of any preceding, word-aligned data.
+        :return int: The data's checksum, in host-byte order.
         """
         full_data = b''.join(data)
-        if len(full_data) & 1: #Odd
-            checksum = sum(self._array_('H', full_data[:-1]))
-            checksum += full_data[-1] #Add the final byte
-        else: #Even
-            checksum = sum(self._array_('H', full_data))
-        checksum = (checksum >> 16) + (checksum & 0xffff)
-        checksum += (checksum >> 16)
+        if len(full_data) & 1: #Odd; pad the final word
+            full_data += b'\0'
+        value = int.from_bytes(full_data, 'big') + partial_sum
+        checksum = value % 0xffff
+        if not checksum and value: #Non-zero data sums to 0xffff, not 0
+            return 0
         return ~checksum & 0xffff
 
-    def _ipChecksum(self, ip_prefix, ip_destination):
+    def _ipChecksum(self, ip_header):
         """
         Computes the checksum of the IPv4 header.
 
-        :param bytes ip_prefix: The portion of the IPv4 header preceding the `checksum` field.
-        :param bytes ip_destination: The destination address, in network-byte order.
+        :param bytes ip_header: The IPv4 header, with an empty `checksum` field.
         :return int: The IPv4 checksum.
         """
-        return self._checksum([
-            ip_prefix,
-            b'\0\0', #Empty checksum field
-            self._server_address,
-            ip_destination,
-        ])
+        return self._checksum((ip_header,))
 
-    def _udpChecksum(self, ip_destination, udp_addressing, udp_length, packet):
+    def _udpChecksum(self, ip_destination, udp_length, udp_datagram):
         """
         Computes the checksum of the UDP header and payload.
 
         :param bytes ip_destination: The destination address, in network-byte order.
-        :param bytes udp_addressing: The UDP header's port section.
         :param bytes udp_length: The length of the UDP payload plus header.
-        :param bytes packet: The serialised packet.
+        :param bytes udp_datagram: The UDP header, with an empty `checksum`
+            field, followed by the serialised packet.
         :return int: The UDP checksum.
         """
-        return self._checksum([
-            self._server_address,
+        return self._checksum((
             ip_destination,
-            b'\0\x11', #UDP spec padding and protocol
             udp_length,
-            udp_addressing,
-            udp_length,
-            b'\0\0', #Dummy UDP checksum
-            packet,
-        ])
+            udp_datagram,
+        ), self._udp_pseudo_sum) or 0xffff #A computed 0 is sent as its complement; 0 means "no checksum"
 
     def _assemblePacket(self, packet, mac, ip, port, source_port):
         """
         Assembles the Ethernet, IPv4, and UDP headers, serialises the packet, and provides a
         complete Ethernet frame for injection into the network.
 
+        The frame is built in a single buffer, with every header written by one
+        pre-compiled structure, and the checksums filled in afterwards.
+
         :param packet: The packet to be written.
         :type packet: :class:`DHCPPacket <dhcp_types.packet.DHCPPacket>`
         :param mac: The MAC to which the packet is addressed.
@@ -644,21 +822,19 @@ class _L2Responder(_Responder):
         :param int source_port: The port from which the packet is addressed.
         :return bytes: The complete binary packet.
         """
-        binary = []
-
-        #<> Ethernet header
-        if _IP_BROADCAST == ip:
-            binary.append(b'\xff\xff\xff\xff\xff\xff') #Broadcast MAC
-        else:
-            binary.append(bytes(mac)) #Destination MAC
-        binary.append(self._ethernet_id) #Source MAC and Ethernet payload-type
-
         #<> Prepare packet data for transmission and checksumming
         binary_packet = packet.encodePacket()
         packet_len = len(binary_packet)
+        ip_destination = socket.inet_aton(ip)
 
-        #<> IP header
-        binary.append(self._pack_("!BBHHHBB",
+        headers = self._headers
+        frame = bytearray(headers.size + packet_len)
+        headers.pack_into(frame, 0,
+            #<> Ethernet header
+            _IP_BROADCAST == ip and b'\xff\xff\xff\xff\xff\xff' or bytes(mac), #Destination MAC
+            self._ethernet_id, #Source MAC and Ethernet payload-type
+
+            #<> IP header
             69, #IPv4 + length=5
             0, #DSCP/ECN aren't relevant
             28 + packet_len, #The UDP and packet lengths in bytes
@@ -666,23 +842,27 @@ class _L2Responder(_Responder):
             packet_len <= 560 and 0b0100000000000000 or 0, #Flags and fragmentation
             128, #Make the default TTL sane, but not maximum
             0x11, #Protocol=UDP
-        ))
-        ip_destination = socket.inet_aton(ip)
-        binary.extend((
-            self._pack_("<H", self._ipChecksum(binary[-1], ip_destination)),
+            0, #Checksum, filled in below
             self._server_address,
-            ip_destination
-        ))
-
-        #<> UDP header
-        binary.append(self._pack_("!HH", source_port, port))
-        binary.append(self._pack_("!H", packet_len + 8)) #8 for the header itself
-        binary.append(self._pack_("<H", self._udpChecksum(ip_destination, binary[-2], binary[-1], binary_packet)))
+            ip_destination,
 
+            #<> UDP header
+            source_port,
+            port,
+            packet_len + 8, #8 for the header itself
+            0, #Checksum, filled in below
+        )
         #<> Payload
-        binary.append(binary_packet)
+        frame[headers.size:] = binary_packet
+
+        ip_offset = self._ip_offset
+        udp_offset = ip_offset + 20
+        self._pack_into_('!H', frame, ip_offset + 10, self._ipChecksum(frame[ip_offset:udp_offset]))
+        self._pack_into_('!H', frame, udp_offset + 6, self._udpChecksum(
+            ip_destination, frame[udp_offset + 4:udp_offset + 6], frame[udp_offset:],
+        ))
 
-        return b''.join(binary)
+        return bytes(frame)
 
     def _send(self, packet, ip, port, source_port=0, **kwargs):
         """
@@ -720,7 +900,8 @@ class _L2Responder_AF_PACKET(_L2Responder):
         """
         self._socket = socket.socket(_AF_PACKET, socket.SOCK_RAW, socket.htons(_ETH_P_SNAP))
         self._socket.bind((response_interface, _ETH_P_SNAP))
-        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2 ** 12)
+        #Room for a burst of replies; nothing is received, so that side stays small
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 2 ** 18)
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2 ** 12)
 
         mac = self._socket.getsockname()[4]
@@ -771,10 +952,8 @@ class _L2Responder_pcap(_L2Responder):
         errbuf = ctypes.create_string_buffer(256)
         self._fd = pcap.pcap_open_live(response_interface.encode('utf-8'), ctypes.c_int(0), ctypes.c_int(0), ctypes.c_int(0), errbuf)
         if not self._fd:
-            import errno
             raise IOError(errno.EACCES, errbuf.value)
         elif errbuf.value:
-            import warnings
             warnings.warn(errbuf.value)
 
         try:
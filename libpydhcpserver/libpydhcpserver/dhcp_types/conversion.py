@@ -23,7 +23,11 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 (C) Neil Tallim, 2021 <neil.tallim@linux.com>
 """
+import struct
+
 _IPv4 = None #: Placeholder for a deferred import to avoid a circular reference.
+_IPV4_CACHE = {} #: Recently converted IPv4s, keyed by their source representation.
+_IPV4_CACHE_SIZE = 1024 #: The number of IPv4s to remember before starting over.
 
 def listToNumber(l):
     """
@@ -32,10 +36,7 @@ def listToNumber(l):
     :param sequence l: A sequence of ints, between ``0`` and ``255``.
     :return int: The corresponding value.
     """
-    value = 0
-    for (i, v) in enumerate(reversed(l)):
-        value += v << (8 * i)
-    return value
+    return int.from_bytes(bytes(l), 'big')
     
 def listToInt(l):
     """
@@ -55,11 +56,8 @@ def listToInts(l):
         multiple of two, zero-padded to LSD.
     :return list: A list of ints corresponding to the byte-pairs.
     """
-    ints = []
-    for i in range(len(l) >> 1):
-        p = i * 2
-        ints.append(listToInt(l[p:p + 2]))
-    return ints
+    count = len(l) >> 1
+    return list(struct.unpack('!{}H'.format(count), bytes(l[:count * 2])))
     
 def listToLong(l):
     """
@@ -79,11 +77,8 @@ def listToLongs(l):
         multiple of four, zero-padded to LSD.
     :return list: A list of ints corresponding to the byte-quartets.
     """
-    longs = []
-    for i in range(len(l) >> 2):
-        p = i * 4
-        longs.append(listToLong(l[p:p + 4]))
-    return longs
+    count = len(l) >> 2
+    return list(struct.unpack('!{}I'.format(count), bytes(l[:count * 4])))
     
 def intToList(i):
     """
@@ -109,7 +104,7 @@ def intsToList(l):
     """
     pairs = []
     for i in l:
-        pairs += intToList(i)
+        pairs.extend((i >> 8 & 0xFF, i & 0xFF))
     return pairs
     
 def longToList(l):
@@ -136,10 +131,10 @@ def longsToList(l):
         bits are considered.
     :return list: The converted values.
     """
-    bytes = []
+    quartets = []
     for i in l:
-        bytes += longToList(i)
-    return bytes
+        quartets.extend((i >> 24 & 0xFF, i >> 16 & 0xFF, i >> 8 & 0xFF, i & 0xFF))
+    return quartets
     
 def listToStr(l):
     """
@@ -176,25 +171,49 @@ def strToPaddedList(s, l):
     """
     padded_list = strToList(s)
     if len(padded_list) < l:
-        padded_list.extend(0 for i in range(l - len(padded_list)))
+        padded_list.extend([0] * (l - len(padded_list)))
     else:
         padded_list = padded_list[:l]
     return padded_list
     
-def listToIP(l):
+def _toIPv4(address):
     """
-    Converts almost anything into an IPv4 address.
+    Converts almost anything into an IPv4 address, sharing instances between
+    calls, since a server sees the same few addresses over and over.
     
-    :param sequence(4) l: The bytes to be converted.
+    :param address: Any valid IPv4 format.
     :return: The equivalent IPv4 address.
-    :except ValueError: The list could not be processed.
+    :except ValueError: The address could not be processed.
     """
     global _IPv4
     if not _IPv4:
         from .ipv4 import IPv4
         _IPv4 = IPv4
         
-    return _IPv4(l)
+    if isinstance(address, (list, bytearray)):
+        key = tuple(address)
+    else:
+        key = address
+    try:
+        return _IPV4_CACHE[key]
+    except KeyError:
+        ip = _IPV4_CACHE[key] = _IPv4(address)
+    except TypeError: #Unhashable
+        return _IPv4(address)
+        
+    if len(_IPV4_CACHE) > _IPV4_CACHE_SIZE:
+        _IPV4_CACHE.clear()
+    return ip
+    
+def listToIP(l):
+    """
+    Converts almost anything into an IPv4 address.
+    
+    :param sequence(4) l: The bytes to be converted.
+    :return: The equivalent IPv4 address.
+    :except ValueError: The list could not be processed.
+    """
+    return _toIPv4(l)
     
 def listToIPs(l):
     """
@@ -226,7 +245,7 @@ def ipToList(ip):
         _IPv4 = IPv4
         
     if not isinstance(ip, _IPv4):
-        ip = _IPv4(ip)
+        ip = _toIPv4(ip)
     return list(ip)
     
 def ipsToList(ips):
@@ -23,7 +23,9 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 (C) Neil Tallim, 2021 <neil.tallim@linux.com>
 (C) Mathieu Ignacio, 2008 <mignacio@april.org>
 """
-from .conversion import (longToList, listToLong)
+import socket
+
+from .conversion import longToList
 
 _MAX_IP_INT = 4294967295
 
@@ -56,7 +58,15 @@ class IPv4(object):
                 address = address.decode('utf-8')
                 
             if isinstance(address, str):
-                octets = (i.strip() for i in address.split('.'))
+                try: #Canonical dotted quads, by far the most common, are parsed in C
+                    packed = socket.inet_pton(socket.AF_INET, address)
+                except (OSError, ValueError):
+                    octets = (i.strip() for i in address.split('.'))
+                else:
+                    self._ip = int.from_bytes(packed, 'big')
+                    self._ip_tuple = tuple(packed)
+                    self._ip_string = address
+                    return
             else:
                 octets = address
                 
@@ -72,25 +82,50 @@ class IPv4(object):
                         ip=address,
                     ))
                     
-                if any(True for i in octets if i < 0 or i > 255):
+                try: #Range-checks every octet in C
+                    packed = bytes(octets)
+                except ValueError:
                     raise ValueError("{ip} is not a valid IPv4: non-byte values present".format(
                         ip=address,
                     ))
                     
                 self._ip_tuple = tuple(octets)
+                self._ip = int.from_bytes(packed, 'big')
                 
     def __eq__(self, other):
-        if not other and not isinstance(other, IPv4):
+        if isinstance(other, IPv4):
+            return self._ip == other._ip
+        if not other:
             return False
         
         if isinstance(other, str):
-            other = IPv4(other)
+            return self._ip == IPv4(other)._ip
         elif isinstance(other, int):
-            return int(self) == other
+            return self._ip == other
         return self._ip_tuple == tuple(other)
         
+    def __lt__(self, other):
+        if not isinstance(other, IPv4):
+            other = IPv4(other)
+        return self._ip < other._ip
+        
+    def __le__(self, other):
+        if not isinstance(other, IPv4):
+            other = IPv4(other)
+        return self._ip <= other._ip
+        
+    def __gt__(self, other):
+        if not isinstance(other, IPv4):
+            other = IPv4(other)
+        return self._ip > other._ip
+        
+    def __ge__(self, other):
+        if not isinstance(other, IPv4):
+            other = IPv4(other)
+        return self._ip >= other._ip
+        
     def __hash__(self):
-        return hash(self._ip_tuple)
+        return hash(self._ip)
         
     def __getitem__(self, index):
         return self._ip_tuple[index]
@@ -99,8 +134,6 @@ class IPv4(object):
         return any(self._ip_tuple)
         
     def __int__(self):
-        if self._ip is None:
-            self._ip = listToLong(self._ip_tuple)
         return self._ip
         
     def __repr__(self):
@@ -25,6 +25,8 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 from .conversion import (listToNumber)
 
+_MAC_SEPARATORS = str.maketrans('', '', ':-. ') #: Removes the delimiters conventionally used in MACs
+
 class MAC(object):
     """
     Provides a standardised way of representing MACs.
@@ -32,6 +34,7 @@ class MAC(object):
     _mac = None #: The MAC encapsulated by this object, as a tuple of bytes.
     _mac_integer = None #: The MAC as an integer.
     _mac_string = None #: The MAC as a colon-delimited, lower-case string.
+    _mac_bytes = None #: The MAC as bytes, in network-byte order.
     
     def __init__(self, address):
         """
@@ -62,14 +65,17 @@ class MAC(object):
                 address = address.decode('utf-8')
                 
             if isinstance(address, str):
-                address = [c for c in address.lower() if c.isdigit() or 'a' <= c <= 'f']
-                if len(address) != 12:
-                    raise ValueError("Expected twelve hex digits as a MAC identifier; received {}".format(len(address)))
-                    
-                mac = []
-                while address:
-                    mac.append(int(address.pop(0), 16) * 16 + int(address.pop(0), 16))
+                try: #Conventionally delimited
+                    mac = bytes.fromhex(address.translate(_MAC_SEPARATORS))
+                except ValueError:
+                    mac = None
+                if mac is None or len(mac) != 6: #Strip anything that isn't hex
+                    address = ''.join(c for c in address.lower() if c.isdigit() or 'a' <= c <= 'f')
+                    if len(address) != 12:
+                        raise ValueError("Expected twelve hex digits as a MAC identifier; received {}".format(len(address)))
+                    mac = bytes.fromhex(address)
                 self._mac = tuple(mac)
+                self._mac_bytes = mac
             else:
                 self._mac = tuple(address)
                 if len(self._mac) != 6 or any((type(d) is not int or d < 0 or d > 255) for d in self._mac):
@@ -103,7 +109,9 @@ class MAC(object):
         return "MAC(%r)" % (str(self))
         
     def __bytes__(self):
-        return bytes(self._mac)
+        if self._mac_bytes is None:
+            self._mac_bytes = bytes(self._mac)
+        return self._mac_bytes
         
     def __str__(self):
         if self._mac_string is None:
@@ -24,6 +24,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 (C) Mathieu Ignacio, 2008 <mignacio@april.org>
 """
 from array import array
+import re
 
 from . import constants
 from .constants import (
@@ -33,7 +34,7 @@ from .constants import (
     FIELD_CIADDR, FIELD_YIADDR, FIELD_SIADDR, FIELD_GIADDR,
     FIELD_CHADDR,
     FIELD_SNAME, FIELD_FILE,
-    MAGIC_COOKIE, MAGIC_COOKIE_ARRAY,
+    MAGIC_COOKIE,
     DHCP_OP_NAMES, DHCP_TYPE_NAMES,
     DHCP_FIELDS, DHCP_FIELDS_TEXT, DHCP_FIELDS_SPECS, DHCP_FIELDS_TYPES,
     DHCP_OPTIONS_TYPES, DHCP_OPTIONS, DHCP_OPTIONS_REVERSE,
@@ -48,8 +49,10 @@ from . import conversion
 
 _MAGIC_COOKIE_POSITION = 236
 _PACKET_HEADER_SIZE = 240
+_FLAGS_POSITION = DHCP_FIELDS[FIELD_FLAGS][0]
+_NON_PAD = re.compile(b'[^\x00]') #: Finds the end of a run of pad options.
 
-_MANDATORY_OPTIONS = set((
+_MANDATORY_OPTIONS = frozenset((
     1, #subnet_mask
     3, #router
     6, #domain_name_servers
@@ -143,16 +146,14 @@ class DHCPPacket(object):
             
         options_position = self._locateOptions(data)
         
-        #Recast the data as an array of bytes
-        packet = array('B', data)
-        
-        options = self._unpackOptions(packet, options_position)
+        options = self._unpackOptions(data, options_position)
         self._options = options
         
         #Extract configuration data
         requested_options = options.get(55) #parameter_request_list
         if requested_options:
-            self._selected_options = _MANDATORY_OPTIONS.union(requested_options)
+            self._selected_options = set(_MANDATORY_OPTIONS) #A mutable copy, since selections can be changed
+            self._selected_options.update(requested_options)
         maximum_datagram_size = 22 in options and conversion.listToInt(options[22])
         maximum_dhcp_size = 57 in options and conversion.listToInt(options[57])
         if maximum_datagram_size and maximum_dhcp_size:
@@ -160,10 +161,10 @@ class DHCPPacket(object):
         else:
             self._maximum_size = maximum_datagram_size or maximum_dhcp_size
             
-        #Cut the packet data down to just the header and keep that.
-        self._header = packet[:_PACKET_HEADER_SIZE]
+        #Keep just the header, as bytes that can be manipulated.
+        self._header = bytearray(data[:_PACKET_HEADER_SIZE])
         if options_position != _PACKET_HEADER_SIZE: #Insert the cookie without padding.
-            self._header[_MAGIC_COOKIE_POSITION:_PACKET_HEADER_SIZE] = MAGIC_COOKIE_ARRAY
+            self._header[_MAGIC_COOKIE_POSITION:_PACKET_HEADER_SIZE] = MAGIC_COOKIE
             
     @property
     def meta(self):
@@ -182,8 +183,8 @@ class DHCPPacket(object):
         Creates a blank packet's structures.
         """
         self._options = {}
-        self._header = array('B', [0] * _PACKET_HEADER_SIZE)
-        self._header[_MAGIC_COOKIE_POSITION:_PACKET_HEADER_SIZE] = MAGIC_COOKIE_ARRAY
+        self._header = bytearray(_PACKET_HEADER_SIZE)
+        self._header[_MAGIC_COOKIE_POSITION:_PACKET_HEADER_SIZE] = MAGIC_COOKIE
         
     def _copy(self, data):
         """
@@ -226,6 +227,37 @@ class DHCPPacket(object):
             self._meta,
         ))
         
+    @classmethod
+    def peekDHCPMessageType(cls, data):
+        """
+        Finds the DHCP message-type of a byte-encoded packet without decoding
+        it, so that packets that will be ignored needn't be fully parsed.
+        
+        :param bytes data: The raw byte-encoded packet.
+        :return int: The DHCP message-type of the packet, -1 if the message-type
+                     is undefined, or None if the data does not represent a
+                     DHCP packet.
+        """
+        position = data.find(MAGIC_COOKIE, _MAGIC_COOKIE_POSITION)
+        if position == -1:
+            return None
+        position += len(MAGIC_COOKIE)
+        end_position = len(data) - 2 #Every option of interest needs two more bytes
+        while position < end_position:
+            option_id = data[position]
+            if option_id == 53: #dhcp_message_type
+                return data[position + 2]
+            if option_id == 0: #Pad options: skip the whole run at once
+                non_pad = _NON_PAD.search(data, position)
+                if not non_pad:
+                    break
+                position = non_pad.start()
+            elif option_id == 255: #End option: stop processing
+                break
+            else:
+                position += 2 + data[position + 1]
+        return -1
+        
     def _locateOptions(self, data):
         """
         Provides the location at which DHCP options begin.
@@ -242,32 +274,37 @@ class DHCPPacket(object):
             raise ValueError("Data received does not represent a DHCP packet: Magic Cookie not found")
         return position + len(MAGIC_COOKIE)
         
-    def _unpackOptions(self, packet, position):
+    def _unpackOptions(self, data, position):
         """
         Extracts all of the options from the packet.
         
-        :param array('B') packet: The packet's raw data.
+        :param bytes data: The raw byte-encoded packet.
         :param int position: The position at which option data begins.
         :return dict: A dictionary of byte-lists, keyed by option ID.
+        :except ValueError: An option was truncated.
         """
-        global DHCP_OPTIONS_TYPES
-        
         options = {}
+        view = memoryview(data) #Values are sliced out without copying the packet
         #Extract extended options from the payload.
-        end_position = len(packet)
+        end_position = len(data)
         while position < end_position:
-            if packet[position] == 0: #Pad option: skip byte.
-                position += 1
+            option_id = data[position]
+            if option_id == 0: #Pad options: skip the whole run at once
+                non_pad = _NON_PAD.search(data, position)
+                if not non_pad:
+                    break
+                position = non_pad.start()
                 continue
             
-            if packet[position] == 255: #End option: stop processing
+            if option_id == 255: #End option: stop processing
                 break
                 
-            option_id = packet[position]
-            option_length = packet[position + 1]
+            if position + 1 == end_position:
+                raise ValueError("Data received does not represent a DHCP packet: option {} is truncated".format(option_id))
+            option_length = data[position + 1]
             position += 2 #Skip the pointer past the identifier and length
             if option_id in DHCP_OPTIONS_TYPES:
-                value = packet[position:position + option_length].tolist()
+                value = view[position:position + option_length].tolist()
                 if option_id in options: #It's a multi-part option
                     options[option_id].extend(value)
                 else:
@@ -283,10 +320,10 @@ class DHCPPacket(object):
         :param dict options: The option-data to be packed.
         :param list(int) option_ordering: The order in which to pack options.
         :param int size_limit: The number of bytes available to pack options.
-        :return tuple(2): A list of packed option bytes and a list containing any
+        :return tuple(2): A bytearray of packed options and a list containing any
                        option-IDs that could not be packed.
         """
-        ordered_options = []
+        ordered_options = bytearray()
         if size_limit <= 0:
             return (ordered_options, option_ordering[:])
             
@@ -319,15 +356,14 @@ class DHCPPacket(object):
         options = {}
         for (option_id, option_value) in self._options.items():
             if self.isSelectedOption(option_id):
-                options[option_id] = option = []
-                while True:
-                    if len(option_value) > 255:
-                        option += [option_id, 255] + option_value[:255]
-                        option_value = option_value[255:]
-                    else:
-                        option += [option_id, len(option_value)] + option_value
-                        break
-                        
+                options[option_id] = option = bytearray()
+                #Values longer than 255 bytes are split across repeated options
+                for position in range(0, len(option_value) or 1, 255):
+                    chunk = option_value[position:position + 255]
+                    option.append(option_id)
+                    option.append(len(chunk))
+                    option.extend(chunk)
+                    
         #Determine the order for options to appear in the packet
         keys = set(options.keys())
         option_ordering = [i for i in _OPTION_ORDERING if i in keys] #Put specific options first
@@ -341,14 +377,14 @@ class DHCPPacket(object):
         payload.extend((0, 0, 0)) #Space for option 52
         if self.terminal_pad:
             terminal_pad_size = min(len(value) % self._word_size, size_limit)
-            payload.extend(0 for i in range(terminal_pad_size)) #Add trailing pads
+            payload.extend(bytes(terminal_pad_size)) #Add trailing pads
         else:
             terminal_pad_size = 0
             
         #Create the byte-array based on the current header for efficiency
         packet = self._header[:]
         #Resize it only once
-        packet.extend(payload)
+        packet += payload
         
         #If there is remaining data, pack it using option 52, if possible.
         option_52 = 0
@@ -361,7 +397,7 @@ class DHCPPacket(object):
             option_52 += option_52_value
             (location, size) = DHCP_FIELDS[field]
             (payload, option_ordering) = self._packOptions(options, option_ordering, size)
-            packet[location:location + len(payload)] = array('B', payload)
+            packet[location:location + len(payload)] = payload
             
         #Set option 52 in the packet if it's required.
         if option_52:
@@ -371,7 +407,7 @@ class DHCPPacket(object):
             packet[-(1 + terminal_pad_size)] = 255 #END
             
         #Encode packet.
-        return packet.tobytes()
+        return bytes(packet)
         
     def _serialiseOptionValue(self, option, value):
         """
@@ -416,7 +452,11 @@ class DHCPPacket(object):
         :param collection value: The sequence to be tested.
         :return bool: True if the sequence is comprised entirely of bytes.
         """
-        return not any(True for v in value if type(v) is not int or not 0 <= v <= 255)
+        try: #bytes() performs the type- and range-checks in C
+            bytes(value)
+        except (TypeError, ValueError):
+            return False
+        return True
         
     def _extractList(self, value, option=None):
         """
@@ -479,8 +519,10 @@ class DHCPPacket(object):
         
         :return int: A sixteen-bit bitmap of option-flags set on the packet.
         """
-        flags = self.getOption('flags')
-        return (flags[0] << 8) + flags[1]
+        #Read straight from the header; flags are checked and toggled for every
+        #response, so the general-purpose option machinery isn't worth its cost
+        header = self._header
+        return (header[_FLAGS_POSITION] << 8) + header[_FLAGS_POSITION + 1]
         
     def _setFlags(self, flags):
         """
@@ -488,7 +530,9 @@ class DHCPPacket(object):
         
         :param int flags: A sixteen-bit bitmap of option-flags to set.
         """
-        self.setOption('flags', [flags >> 8 & 0xFF, flags & 0xFF])
+        header = self._header
+        header[_FLAGS_POSITION] = flags >> 8 & 0xFF
+        header[_FLAGS_POSITION + 1] = flags & 0xFF
         
     def getFlag(self, bitflag):
         """
@@ -582,7 +626,7 @@ class DHCPPacket(object):
         """
         if option in DHCP_FIELDS:
             (start, length) = DHCP_FIELDS[option]
-            self._header[start:start + length] = array('B', [0] * length)
+            self._header[start:start + length] = bytes(length)
             return True
         else:
             id = self._getOptionID(option)
@@ -601,7 +645,7 @@ class DHCPPacket(object):
         """
         if option in DHCP_FIELDS:
             (start, length) = DHCP_FIELDS[option]
-            value = self._header[start:start + length].tolist()
+            value = list(self._header[start:start + length])
             if convert:
                 return self._deserialiseOptionValue(option, value)
             return value
@@ -642,7 +686,7 @@ class DHCPPacket(object):
                     value_length=len(value),
                     value=value,
                 ))
-            replacement = array('B', value)
+            replacement = bytearray(value)
             if padding:
                 replacement.extend(padding)
             self._header[start:start + length] = replacement
@@ -762,8 +806,8 @@ class DHCPPacket(object):
         :return int: The DHCP message-type of this packet or -1 if the
                      message-type is undefined.
         """
-        dhcp_message_type = self.getOption(53)
-        if dhcp_message_type is None:
+        dhcp_message_type = self._options.get(53) #The ID is known, so skip resolution
+        if not dhcp_message_type:
             return -1
         return dhcp_message_type[0]
 
@@ -23,7 +23,7 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 (C) Neil Tallim, 2021 <neil.tallim@linux.com>
 """
-from .conversion import (intToList, longToList)
+from .conversion import (intToList, listToNumber, longToList)
 from .ipv4 import IPv4
 
 def rfc3046_decode(s):
@@ -54,12 +54,15 @@ def rfc3925_decode(s, identifier_size=4):
     :return dict: A dictionary of data as strings keyed by ID numbers.
     """
     data = {}
-    while s:
-        enterprise_number = conversion.listToNumber(s[:identifier_size])
-        payload_size = s[identifier_size]
-        payload = s[1 + identifier_size:1 + identifier_size + payload_size]
-        s = s[1 + identifier_size + payload_size:]
-        data[enterprise_number] = payload
+    position = 0
+    end_position = len(s)
+    while position < end_position:
+        enterprise_number = listToNumber(s[position:position + identifier_size])
+        position += identifier_size
+        payload_size = s[position]
+        position += 1
+        data[enterprise_number] = s[position:position + payload_size]
+        position += payload_size
     return data
     
 def rfc3925_125_decode(value):
@@ -34,9 +34,9 @@ import ctypes.util
 import socket
 
 #Linux constants that might not be present in Python
-_AF_PACKET = (hasattr(socket, 'AF_PACKET') and socket.AF_PACKET) or 17
+_AF_PACKET = getattr(socket, 'AF_PACKET', 17)
 #BSD constants that might not be present in Python
-_AF_LINK = (hasattr(socket, 'AF_LINK') and socket.AF_LINK) or 18
+_AF_LINK = getattr(socket, 'AF_LINK', 18)
 
 _LIBC = ctypes.CDLL(ctypes.util.find_library('c'))
 
@@ -63,6 +63,7 @@ Like staticDHCPd, this module under the GNU General Public License v3
 (C) Neil Tallim, 2021 <neil.tallim@linux.com>
 """
 import collections
+import heapq
 import logging
 import threading
 import time
@@ -99,6 +100,15 @@ else:
         else:
             _logger.info("scapy imported successfully; automatic ARPing is available")
             
+_IP_TO_HOSTNAME = str.maketrans('.', '-')
+
+def _to_wall_time(timestamp):
+    """
+    Converts a `time.monotonic()` timestamp, as used for lease-tracking, into
+    a UNIX timestamp.
+    """
+    return timestamp + (time.time() - time.monotonic())
+    
 _LeaseDefinition = collections.namedtuple('LeaseDefinition', ('ip', 'mac', 'expiration', 'last_seen'))
 """
 Provides lease-definition information for an IP.
@@ -117,12 +127,13 @@ def _dynamic_method(method):
     """
     def wrapped_method(self, *args, **kwargs):
         with self._lock:
+            self._current_time = time.monotonic()
             self._cleanup_leases() #Remove stale assignments
             ip = method(self, *args, **kwargs)
             if ip:
                 return Definition(
                     ip=ip, lease_time=self._lease_time, subnet=self._subnet, serial=self._serial,
-                    hostname=(self._hostname_pattern.format(ip=str(ip).replace('.', '-'))),
+                    hostname=(self._hostnames.get(ip) or self._format_hostname(ip)),
                     gateways=self._gateway, subnet_mask=self._subnet_mask, broadcast_address=self._broadcast_address,
                     domain_name=self._domain_name, domain_name_servers=self._domain_name_servers, ntp_servers=self._ntp_servers,
                     extra=None,
@@ -180,8 +191,11 @@ class DynamicPool(object):
         self._discourage_renewals = discourage_renewals
         
         self._logger = _logger.getChild(self._hostname_prefix)
-        self._pool = collections.deque()
+        self._pool = collections.OrderedDict() #IPs -> themselves, in allocation order
         self._map = {}
+        self._expirations = []
+        self._current_time = None #Sampled once per locked operation
+        self._hostnames = {}
         self._lock = threading.Lock()
         
         self._logger.info("Created dynamic provisioning pool '{}'".format(self._hostname_prefix))
@@ -208,12 +222,14 @@ class DynamicPool(object):
         """
         ips = dict((ip, IPv4(ip)) for ip in ips)
         with self._lock:
-            #Filter out duplicates
+            #Filter out duplicates, preparing hostnames for everything else
             allocated_ips = set(ip for (_, ip) in self._map.values())
             duplicate_ips = []
             for (ip, ip_obj) in ips.items():
                 if ip_obj in self._pool or ip_obj in allocated_ips:
                     duplicate_ips.append(ip)
+                else:
+                    self._hostnames[ip_obj] = self._format_hostname(ip_obj)
             if duplicate_ips:
                 for ip in duplicate_ips:
                     del ips[ip]
@@ -221,7 +237,7 @@ class DynamicPool(object):
                 
             #Try to ARP addresses
             if arp_addresses and arping:
-                expiration = time.time() + self._lease_time
+                expiration = time.monotonic() + self._lease_time
                 mapped_ips_count = 0
                 self._logger.info("Beginning ARP-lookup for {} IPs in pool '{}', with timeout={:.3f}s".format(
                     len(ips),
@@ -239,28 +255,36 @@ class DynamicPool(object):
                     else:
                         mapped_ips_count += 1
                         self._map[mac] = [expiration, ip_obj]
+                        heapq.heappush(self._expirations, (expiration, mac))
                         self._logger.info("ARP-discovered {} bound to {} in pool '{}'; providing lease until {}".format(
                             ip_obj,
                             mac,
                             self._hostname_prefix,
-                            time.ctime(expiration),
+                            time.ctime(_to_wall_time(expiration)),
                         ))
                 self._logger.info("{} IPs automatically bound in pool '{}'".format(
                     mapped_ips_count,
                     self._hostname_prefix,
                 ))
-            self._pool.extend(ips.values())
+            self._pool.update((ip_obj, ip_obj) for ip_obj in ips.values())
             total = len(self._pool) + len(self._map)
-        self._logger.debug("Added IPs to dynamic pool '{}': {}".format(
-            self._hostname_prefix,
-            sorted(ips.values()),
-        ))
+        if self._logger.isEnabledFor(logging.DEBUG): #Don't sort large pools just to discard the result
+            self._logger.debug("Added IPs to dynamic pool '{}': {}".format(
+                self._hostname_prefix,
+                sorted(ips.values(), key=int),
+            ))
         self._logger.info("Added {} available IPs to dynamic pool '{}'; new total: {}".format(
             len(ips),
             self._hostname_prefix,
             total,
         ))
         
+    def _format_hostname(self, ip):
+        """
+        Renders the hostname offered with `ip`.
+        """
+        return self._hostname_pattern.format(ip=str(ip).translate(_IP_TO_HOSTNAME))
+        
     def handle(self, method, packet, mac, client_ip):
         """
         Processes a dynamic request, returning a synthesised lease, if possible.
@@ -305,8 +329,9 @@ class DynamicPool(object):
         """
         elements = []
         with self._lock:
+            offset = _to_wall_time(0)
             for (mac, (expiration, ip)) in self._map.items():
-                elements.append(_LeaseDefinition(ip, mac, expiration, expiration - self._lease_time))
+                elements.append(_LeaseDefinition(ip, mac, expiration + offset, expiration + offset - self._lease_time))
             for ip in self._pool:
                 elements.append(_LeaseDefinition(ip, None, None, None))
         return tuple(sorted(elements))
@@ -352,7 +377,7 @@ class DynamicPool(object):
                 </tr>""".format(
                     ip=ip,
                     mac=mac,
-                    expiration=time.ctime(expiration),
+                    expiration=time.ctime(_to_wall_time(expiration)),
                 ))
             return """
             <table class="element">
@@ -378,19 +403,24 @@ class DynamicPool(object):
             
     def _cleanup_leases(self):
         """
-        Reclaims IPs for which leases have lapsed.
+        Reclaims IPs for which leases have lapsed as of `_current_time`.
+        
+        `_expirations` is a heap that may contain stale entries for renewed or
+        released leases; they are discarded as they reach the top.
         
         Must be called from a context in which the lock is held.
         """
-        current_time = time.time()
-        dead_records = []
-        for (mac, (expiration, ip)) in self._map.items():
-            if current_time - expiration > self._lease_time: #Kill it
-                dead_records.append((mac, ip))
+        threshold = self._current_time - self._lease_time
+        expirations = self._expirations
+        while expirations and expirations[0][0] < threshold:
+            (expiration, mac) = heapq.heappop(expirations)
+            match = self._map.get(mac)
+            if not match or match[0] != expiration: #Superseded
+                continue
                 
-        for (mac, ip) in dead_records:
+            ip = match[1]
             del self._map[mac]
-            self._pool.append(ip)
+            self._pool[ip] = ip
             self._logger.debug("Reclaimed expired IP {} from {} in pool '{}'".format(
                 ip,
                 mac,
@@ -407,7 +437,7 @@ class DynamicPool(object):
         if match: #Drop the lease and reclaim the IP
             ip = match[1]
             del self._map[mac]
-            self._pool.append(ip)
+            self._pool[ip] = ip
             self._logger.info("Reclaimed released IP {} from {} in pool '{}'".format(
                 ip,
                 mac,
@@ -437,33 +467,29 @@ class DynamicPool(object):
                 ))
                 return None
                 
-            match[0] = time.time() + self._lease_time
+            match[0] = self._current_time + self._lease_time
+            heapq.heappush(self._expirations, (match[0], mac))
             self._logger.info("Extended lease of {} to {} in pool '{}' until {}".format(
                 ip,
                 mac,
                 self._hostname_prefix,
-                time.ctime(match[0]),
+                time.ctime(_to_wall_time(match[0])),
             ))
             return ip
         else:
             if self._pool:
-                if client_ip: #Search for the requested IP in the pool
-                    for (i, ip) in enumerate(self._pool):
-                        if ip == client_ip:
-                            del self._pool[i]
-                            break
-                    else:
-                        ip = self._pool.popleft()
-                else:
-                    ip = self._pool.popleft()
+                ip = client_ip and self._pool.pop(client_ip, None) #Honour the requested IP, if available
+                if not ip:
+                    (_, ip) = self._pool.popitem(last=False)
                     
-                expiration = time.time() + self._lease_time
+                expiration = self._current_time + self._lease_time
                 self._map[mac] = [expiration, ip]
+                heapq.heappush(self._expirations, (expiration, mac))
                 self._logger.info("Bound {} to {} in pool '{}' until {}".format(
                     ip,
                     mac,
                     self._hostname_prefix,
-                    time.ctime(expiration),
+                    time.ctime(_to_wall_time(expiration)),
                 ))
                 return ip
             return None
@@ -92,6 +92,7 @@ del _config
 ################################################################################
 import collections
 import datetime
+import itertools
 import logging
 import threading
 import time
@@ -125,7 +126,9 @@ class Statistics(object):
         self._processing_time = 0.0
 
         self._graph = collections.deque((None for i in range(graph_size)), maxlen=graph_size)
+        self._graph_version = 0
         self._gram_size = gram_size
+        self._renderings = {}
 
         self._lock = threading.Lock()
 
@@ -151,10 +154,10 @@ class Statistics(object):
         with self._lock:
             current_time = time.time()
             if self._gram_start_time <= current_time - self._gram_size:
-                #Insert null grams as needed
+                #Insert null grams as needed; anything beyond the graph's length
+                #would just fall off the far end
                 steps = int((current_time - self._gram_start_time) / max(1, self._gram_size))
-                for i in range(1, steps):
-                    self._graph.append(None)
+                self._graph.extend(itertools.repeat(None, min(steps - 1, self._graph.maxlen)))
 
                 if self._activity:
                     self._graph.append(_Gram(
@@ -167,7 +170,29 @@ class Statistics(object):
                     self._activity = False
                 else:
                     self._graph.append(None)
+                self._graph_version += 1
+
+    def _snapshot_graph(self, key):
+        """
+        Returns the rendering of `key` if it was produced against the current
+        version of the graph, which means it can't have changed, or None,
+        followed by that version, the current gram's start time, and a copy of
+        the graph, so that rendering doesn't hold the lock; grams are never
+        modified once added.
+        """
+        with self._lock:
+            (version, rendering) = self._renderings.get(key, (None, None))
+            if version == self._graph_version:
+                return (rendering, version, None, None)
+            return (None, self._graph_version, self._gram_start_time, tuple(self._graph))
 
+    def _store_rendering(self, key, version, rendering):
+        """
+        Keeps `rendering` for reuse until the graph next changes.
+        """
+        self._renderings[key] = (version, rendering)
+        return rendering
+            
     def process(self, statistics):
         """
         Updates the statstics engine's data.
@@ -194,6 +219,9 @@ class Statistics(object):
         and the events that occurred during the corresponding period.
         """
         self._update_graph()
+        (rendering, version, base_time, graph) = self._snapshot_graph('csv')
+        if rendering is not None:
+            return rendering
 
         import csv
         import io
@@ -210,19 +238,17 @@ class Statistics(object):
         null_record = ['0' for i in range(len(_METHODS) * 2)] + ['0', '0']
 
         render_format = '%Y-%m-%d %H:%M:%S'
-        with self._lock:
-            base_time = self._gram_start_time
-            for (i, gram) in enumerate(reversed(self._graph)):
-                record = [time.strftime(render_format, time.localtime(base_time - (i * self._gram_size)))]
-                if gram:
-                    record.extend(gram.dhcp_packets[i] for i in _METHODS)
-                    record.extend(gram.dhcp_packets_discarded[i] for i in _METHODS)
-                    record.extend((gram.other_packets, gram.processing_time))
-                    writer.writerow(record)
-                else:
-                    writer.writerow(record + null_record)
+        for (i, gram) in enumerate(reversed(graph)):
+            record = [time.strftime(render_format, time.localtime(base_time - (i * self._gram_size)))]
+            if gram:
+                record.extend(gram.dhcp_packets[i] for i in _METHODS)
+                record.extend(gram.dhcp_packets_discarded[i] for i in _METHODS)
+                record.extend((gram.other_packets, gram.processing_time))
+                writer.writerow(record)
+            else:
+                writer.writerow(record + null_record)
         output.seek(0)
-        return ('text/csv', output.read())
+        return self._store_rendering('csv', version, ('text/csv', output.read()))
     
     def graph_json(self):
         """
@@ -230,6 +256,9 @@ class Statistics(object):
         and the events that occurred during the corresponding period.
         """
         self._update_graph()
+        (rendering, version, base_time, graph) = self._snapshot_graph('json')
+        if rendering is not None:
+            return rendering
 
         import json
         
@@ -242,30 +271,32 @@ class Statistics(object):
             "processing_time": 0.0,
         }
         
-        with self._lock:
-            base_time = self._gram_start_time
-            for (i, gram) in enumerate(reversed(self._graph)):
-                gram_time = base_time - (i * self._gram_size)
-                if gram:
-                    record = {
-                        'time': gram_time,
-                        'other_packets': gram.other_packets,
-                        'processing_time': gram.processing_time,
-                        'methods': gram.dhcp_packets,
-                        'methods_discarded': gram.dhcp_packets_discarded,
-                    }
-                else:
-                    record = null_record.copy()
-                    record["time"] = gram_time
-                output.append(record)
+        for (i, gram) in enumerate(reversed(graph)):
+            gram_time = base_time - (i * self._gram_size)
+            if gram:
+                record = {
+                    'time': gram_time,
+                    'other_packets': gram.other_packets,
+                    'processing_time': gram.processing_time,
+                    'methods': gram.dhcp_packets,
+                    'methods_discarded': gram.dhcp_packets_discarded,
+                }
+            else:
+                record = null_record.copy()
+                record["time"] = gram_time
+            output.append(record)
         output.reverse()
-        return ('application/json', json.dumps(output))
+        return self._store_rendering('json', version, ('application/json', json.dumps(output)))
 
     def graph(self, dimensions):
         """
         Uses Chart.js to render a client-side graph of average DHCP activity.
         """
         self._update_graph()
+        key = ('chart', tuple(dimensions))
+        (rendering, version, base_time, graph) = self._snapshot_graph(key)
+        if rendering is not None:
+            return rendering
         
         import json
 
@@ -298,30 +329,27 @@ class Statistics(object):
                     "hidden": True,
                 })
                 
-        with self._lock:
-            base_time = self._gram_start_time
+        #This would add the current frame, but it doesn't average well and would skew Y
+        #data = [sum(self._current_gram['dhcp-packets'].values()) / (time.time() - self._gram_start_time)]
+        for (i, gram) in enumerate(graph):
+            gram_time = int((base_time - ((len(graph) - i - 1) * self._gram_size)) * 1000)
             
-            #This would add the current frame, but it doesn't average well and would skew Y
-            #data = [sum(self._current_gram['dhcp-packets'].values()) / (time.time() - self._gram_start_time)]
-            for (i, gram) in enumerate(self._graph):
-                gram_time = int((base_time - ((len(self._graph) - i - 1) * self._gram_size)) * 1000)
-                
-                if gram:
-                    packets_per_second.append({'x': gram_time, 'y': sum(gram.dhcp_packets.values()) / self._gram_size})
-                    for method in _METHODS:
-                        if method_values:
-                            method_values[method].append({'x': gram_time, 'y': gram.dhcp_packets[method]})
-                        if method_discarded_values:
-                            method_discarded_values[method].append({'x': gram_time, 'y': gram.dhcp_packets_discarded[method]})
-                else:
-                    packets_per_second.append({'x': gram_time, 'y': 0})
-                    for method in _METHODS:
-                        if method_values:
-                            method_values[method].append({'x': gram_time, 'y': 0})
-                        if method_discarded_values:
-                            method_discarded_values[method].append({'x': gram_time, 'y': 0})
-
-        return """
+            if gram:
+                packets_per_second.append({'x': gram_time, 'y': sum(gram.dhcp_packets.values()) / self._gram_size})
+                for method in _METHODS:
+                    if method_values:
+                        method_values[method].append({'x': gram_time, 'y': gram.dhcp_packets[method]})
+                    if method_discarded_values:
+                        method_discarded_values[method].append({'x': gram_time, 'y': gram.dhcp_packets_discarded[method]})
+            else:
+                packets_per_second.append({'x': gram_time, 'y': 0})
+                for method in _METHODS:
+                    if method_values:
+                        method_values[method].append({'x': gram_time, 'y': 0})
+                    if method_discarded_values:
+                        method_discarded_values[method].append({'x': gram_time, 'y': 0})
+
+        return self._store_rendering(key, version, """
         <canvas id="%(chart_id)s" width="%(width)i" height="%(height)i"></canvas>
         <script>
             const ctx = document.getElementById('%(chart_id)s').getContext('2d');
@@ -376,7 +404,7 @@ class Statistics(object):
             "height": dimensions[1],
             "datasets": json.dumps(datasets),
             "show_legend": (method_values or method_discarded_values) and 'true' or 'false',
-        }
+        })
         
     def lifetime_stats(self):
         """
@@ -50,8 +50,6 @@ for conf_path in conf_search_paths:
     sys.path.append(conf_path)
     try: #Attempt to import conf.py from the path
         conf = SourceFileLoader('conf', os.path.join(conf_path, 'conf.py')).load_module()
-        print(repr(conf))
-        print(dir(conf))
     except IOError:
         sys.path.remove(conf_path)
     else:
@@ -94,6 +92,7 @@ _defaults.update({
 _defaults.update({
     'USE_CACHE': False,
     'CACHING_MODEL': 'in-process',
+    'CACHE_MAX_ENTRIES': 4096,
 
     'DISK_CACHE': False,
     'DISK_CACHE_PERSISTENT': None,
@@ -108,6 +107,7 @@ _defaults.update({
     'EXTRA_SUBNETS': None,
 
     'USE_POOL': True,
+    'SQL_BATCH_WINDOW': None,
 
     'POSTGRESQL_HOST': None,
     'POSTGRESQL_PORT': 5432,
@@ -136,6 +136,9 @@ _defaults.update({
     'MISBEHAVING_CLIENT_TIMEOUT': 150,
     'ENABLE_SUSPEND': True,
     'SUSPEND_THRESHOLD': 10,
+
+    'DHCP_WORKER_THREADS': 16,
+    'DHCP_QUEUE_SIZE': 256,
 })
 
 #Logging settings
@@ -190,15 +193,16 @@ _REMAPPED_KEYS = {
     #PXE_PORT was renamed to PROXY_PORT because its role was misunderstood
     'PXE_PORT': 'PROXY_PORT',
 } #keys that have had name-changes since prior versions
-for key in [k for k in dir(conf) if k.isupper()]: #Copy everything that looks like a constant.
-    new_key = _REMAPPED_KEYS.get(key, key)
-    globals()[new_key] = getattr(conf, key)
+_namespace = globals()
+for (key, value) in tuple(vars(conf).items()): #Copy everything that looks like a constant.
+    if key.isupper():
+        _namespace[_REMAPPED_KEYS.get(key, key)] = value
 del _REMAPPED_KEYS
 
 for (key, value) in _defaults.items():
-    if not key in globals():
-        globals()[key] = value
+    _namespace.setdefault(key, value)
 del _defaults
+del _namespace
 
 #Bind known functions and handle backwards-compatibility
 #######################################
@@ -22,14 +22,19 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 (C) Neil Tallim, 2021 <flan@uguu.ca>
 """
+import collections
 import json
 import logging
 import threading
+import time
 
 from .generic import (Database, Definition)
 
 _logger = logging.getLogger('databases._caching')
 
+_MAC_CACHE_SHARDS = 16 #: The number of independently-locked partitions of the in-memory MAC cache; a power of two
+_MAC_CACHE_SHARD_MASK = _MAC_CACHE_SHARDS - 1 #: Selects a shard from a MAC's hash
+
 class _DatabaseCache(Database):
     """
     A node in a caching chain.
@@ -37,6 +42,8 @@ class _DatabaseCache(Database):
     _cache_lock = None #: A lock to prevent race conditions
     _chained_cache = None #: The next node in the caching chain
     _name = None #: The name of this node
+    _lockless_reads = False #: Whether _lookupMAC() is safe to call without holding _cache_lock
+    _lockless_writes = False #: Whether _cacheMAC() handles its own locking, so _cache_lock need not be held
 
     def __init__(self, name, chained_cache=None):
         """
@@ -72,8 +79,11 @@ class _DatabaseCache(Database):
     def lookupMAC(self, mac):
         _mac = str(mac)
         _logger.debug("Searching for '{}' in database-cache '{}'...".format(_mac, self))
-        with self._cache_lock:
+        if self._lockless_reads:
             definition = self._lookupMAC(mac)
+        else:
+            with self._cache_lock:
+                definition = self._lookupMAC(mac)
 
         if not definition:
             _logger.debug("No match for '{}' in database-cache '{}'".format(_mac, self))
@@ -89,75 +99,146 @@ class _DatabaseCache(Database):
 
     def cacheMAC(self, mac, definition, chained=False):
         _logger.debug("Setting definition for '{}' in database-cache '{}'...".format(mac, self))
-        with self._cache_lock:
+        if self._lockless_writes:
             self._cacheMAC(mac, definition, chained=chained)
+        else:
+            with self._cache_lock:
+                self._cacheMAC(mac, definition, chained=chained)
 
         if self._chained_cache and not chained:
             self._chained_cache.cacheMAC(mac, definition, chained=False)
     def _cacheMAC(self, mac, definition, chained): pass
 
+    def invalidateMAC(self, mac):
+        """
+        Drops any cached definition for `mac` from this node and every node
+        chained beneath it.
+
+        :param mac: The MAC whose definition should be forgotten.
+        """
+        _logger.debug("Invalidating definition for '{}' in database-cache '{}'...".format(mac, self))
+        with self._cache_lock:
+            self._invalidateMAC(mac)
+
+        if self._chained_cache:
+            self._chained_cache.invalidateMAC(mac)
+    def _invalidateMAC(self, mac): pass
+
 
 class MemoryCache(_DatabaseCache):
     """
     An optimised in-memory database cache.
+    
+    Reads are lock-free: lookups work against references to the current
+    structures, and reinitialisation publishes fresh ones rather than clearing
+    the live ones. MACs are striped across independently-locked shards, so
+    concurrent cache-fills for different MACs rarely contend.
+
+    Each shard is a bounded LRU, and entries are dropped once they have been
+    held for longer than their lease-time, so memory use cannot grow without
+    limit on networks with many transient clients.
     """
-    _mac_cache = None #: A dictionary of cached MACs
-    _subnet_cache = None #: A dictionary of cached subnet/serial data
+    _lockless_reads = True
+    _lockless_writes = True
+    _mac_shards = None #: A list of (ordered dictionary of cached definitions, lock) pairs
+    _subnet_cache = None #: A dictionary of subnet/serial data, used to share it between definitions
+    _shard_capacity = None #: The number of MACs each shard may hold, or None if unbounded
 
-    def __init__(self, name, chained_cache=None):
+    def __init__(self, name, max_entries=None, chained_cache=None):
         """
         Initialises the cache.
 
         :param basestring name: The name of the cache.
+        :param int max_entries: The approximate number of MACs to hold before
+            evicting the least-recently-used; None if unbounded.
         :param :class:`_DatabaseCache <_DatabaseCache>` chained_cache: The next
             node in the chain; None if this is the end.
         """
         _DatabaseCache.__init__(self, name, chained_cache=chained_cache)
 
-        self._mac_cache = {}
-        self._subnet_cache = {}
+        if max_entries:
+            self._shard_capacity = max(1, -(-max_entries // _MAC_CACHE_SHARDS))
+        self._reinitialise()
         _logger.debug("In-memory database-cache initialised")
 
     def _reinitialise(self):
-        self._mac_cache.clear()
-        self._subnet_cache.clear()
+        self._mac_shards = [(collections.OrderedDict(), threading.Lock()) for i in range(_MAC_CACHE_SHARDS)]
+        self._subnet_cache = {}
 
     def _lookupMAC(self, mac):
-        cache = self._mac_cache.get(int(mac))
-        if cache:
-            definitions = []
-            for data in cache:
-                (ip, hostname, extra, subnet_id) = data
-                details = self._subnet_cache[subnet_id]
-                definitions.append(Definition(
-                    ip=ip, lease_time=details[6], subnet=subnet_id[0], serial=subnet_id[1],
-                    hostname=hostname,
-                    gateways=details[0], subnet_mask=details[1], broadcast_address=details[2],
-                    domain_name=details[3], domain_name_servers=details[4], ntp_servers=details[5],
-                    extra=extra,
-                ))
-            if definitions:
-                if len(definitions) == 1:
-                    return definitions[0]
-                return definitions
+        #Snapshot the reference, so a concurrent reinitialisation can't change
+        #the structure mid-lookup
+        key = int(mac)
+        shard = self._mac_shards[hash(key) & _MAC_CACHE_SHARD_MASK][0]
+        entry = shard.get(key)
+        if entry:
+            (expiration, definition) = entry
+            if expiration < time.monotonic(): #Older than its lease; let it be refreshed
+                return None
+            try:
+                shard.move_to_end(key)
+            except KeyError: #Evicted concurrently; the data is still good for this lookup
+                pass
+            #Callers may modify what they receive, so hand out copies
+            if isinstance(definition, Definition):
+                return definition.copy()
+            return [d.copy() for d in definition]
         return None
 
+    def _shareSubnetDetails(self, definition, subnet_cache):
+        """
+        Points `definition`'s subnet-level fields at the objects already
+        cached for its subnet, if they are equivalent, so MACs in the same
+        subnet share one copy of that data.
+
+        :param :class:`Definition` definition: The definition to be cached.
+        :param dict subnet_cache: The subnet cache to consult and update.
+        """
+        subnet_id = (definition.subnet, definition.serial)
+        details = (
+            definition.gateways, definition.subnet_mask, definition.broadcast_address,
+            definition.domain_name, definition.domain_name_servers, definition.ntp_servers,
+            definition.lease_time,
+        )
+        cached_details = subnet_cache.get(subnet_id)
+        if cached_details == details:
+            (
+                definition.gateways, definition.subnet_mask, definition.broadcast_address,
+                definition.domain_name, definition.domain_name_servers, definition.ntp_servers,
+                definition.lease_time,
+            ) = cached_details
+        else:
+            subnet_cache[subnet_id] = details
+
     def _cacheMAC(self, mac, definition, chained):
+        #Definitions are stored fully assembled, so a hit is a single lookup;
+        #the caller keeps its own object, so the cached one is a copy
         if isinstance(definition, Definition):
-            definitions = (definition,)
+            definitions = (definition.copy(),)
+            definition = definitions[0]
         else:
-            definitions = definition
+            definitions = definition = tuple(d.copy() for d in definition)
             
-        mac_cache = []
-        for definition in definitions:
-            subnet_id = (definition.subnet, definition.serial)
-            mac_cache.append((definition.ip, definition.hostname, definition.extra, subnet_id))
-            self._subnet_cache[subnet_id] = (
-                definition.gateways, definition.subnet_mask, definition.broadcast_address,
-                definition.domain_name, definition.domain_name_servers, definition.ntp_servers,
-                definition.lease_time,
-            )
-        self._mac_cache[int(mac)] = mac_cache
+        mac_shards = self._mac_shards
+        subnet_cache = self._subnet_cache
+        for d in definitions:
+            self._shareSubnetDetails(d, subnet_cache)
+        expiration = time.monotonic() + min(d.lease_time for d in definitions)
+        
+        key = int(mac)
+        (shard, shard_lock) = mac_shards[hash(key) & _MAC_CACHE_SHARD_MASK]
+        with shard_lock:
+            shard[key] = (expiration, definition)
+            shard.move_to_end(key)
+            if self._shard_capacity:
+                while len(shard) > self._shard_capacity:
+                    shard.popitem(last=False)
+
+    def _invalidateMAC(self, mac):
+        key = int(mac)
+        (shard, shard_lock) = self._mac_shards[hash(key) & _MAC_CACHE_SHARD_MASK]
+        with shard_lock:
+            shard.pop(key, None)
 
 
 class MemcachedCache(_DatabaseCache):
@@ -235,6 +316,9 @@ class MemcachedCache(_DatabaseCache):
         cache_records[str(mac)] = json.dumps(mac_list)
         self.mc_client.set_many(cache_records, expire=self.memcached_age_time)
         
+    def _invalidateMAC(self, mac):
+        self.mc_client.delete(str(mac))
+        
     def _create_subnet_key(self, subnet_id):
         return "{}-{}".format(subnet_id[0].replace(" ", "_"), subnet_id[1])
 
@@ -389,3 +473,9 @@ class DiskCache(_DatabaseCache):
         ))
         database.commit()
         self._disconnect(database, cursor)
+
+    def _invalidateMAC(self, mac):
+        (database, cursor) = self._connect()
+        cursor.execute("DELETE FROM maps WHERE mac = ?", (int(mac),))
+        database.commit()
+        self._disconnect(database, cursor)
@@ -25,6 +25,9 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 import itertools
 import logging
+import queue
+import threading
+import time
 
 from .. import config
 
@@ -43,7 +46,152 @@ if config.EXTRA_SUBNETS:
 if not _extra:
     _extra = None
     
+#Used to resolve many MACs in one round-trip; rows are keyed by the leading
+#column and `{macs}` is filled with a backend-specific placeholder per MAC
+_QUERY_MAC_BATCH = """SELECT
+        {mac},
+        m.ip, m.hostname,
+        s.gateway, s.subnet_mask, s.broadcast_address, s.domain_name, s.domain_name_servers,
+        s.ntp_servers, s.lease_time, s.subnet, s.serial{extra}
+    FROM maps m, subnets s
+    WHERE
+        {mac} IN ({{macs}}) AND
+        m.subnet = s.subnet AND
+        m.serial = s.serial""".format(
+    extra=(_extra and ','.join(itertools.chain(
+        ('',),
+        ('m.{}'.format(i) for i in config.EXTRA_MAPS),
+        ('s.{}'.format(i) for i in config.EXTRA_SUBNETS),
+    )) or ''),
+    mac=(config.CASE_INSENSITIVE_MACS and 'LOWER(m.mac)' or 'm.mac'),
+)
+_BATCH_LIMIT = 256 #: The most MACs to place in a single IN clause, keeping well clear of backend limits
+
+class _PendingLookup(object):
+    """
+    A MAC waiting on the outcome of a batched lookup.
+    """
+    event = None #: Set once `result` or `error` is populated
+    result = None #: The resolved Definition, or None
+    error = None #: The exception raised while resolving the batch, if any
+    
+    def __init__(self):
+        self.event = threading.Event()
+        
+class _ConnectionPool(object):
+    """
+    A bounded collection of live DB API 2.0 connections, reused across lookups
+    to avoid paying connection-setup costs on every cache-miss.
+    """
+    _module = None #: The db2api-compliant module to use
+    _connection_details = None #: The module-specific details needed to connect to a database
+    _idle = None #: A LIFO queue of (connection, last-used) pairs, so hot connections are reused first
+    _max_idle = None #: The number of seconds after which an idle connection is discarded
+    _validate = None #: A callable that raises an exception if a connection is no longer usable
+    _validate_after = None #: The number of idle seconds after which a connection is validated before reuse
     
+    def __init__(self, module, connection_details, max_size, max_idle=30, validate=None, validate_after=5):
+        """
+        Sets up an empty pool; connections are established lazily.
+        
+        :param module module: The db2api-compliant module to use.
+        :param dict connection_details: The module-specific details needed to
+                                        connect to a database.
+        :param int max_size: The maximum number of idle connections to retain.
+        :param int max_idle: The number of seconds after which an idle
+                             connection is discarded instead of reused.
+        :param callable validate: Invoked with a connection being reused,
+                                  raising an exception if it is broken.
+        :param int validate_after: The number of seconds a connection must have
+                                   been idle before `validate` is invoked;
+                                   recently-used connections are trusted.
+        """
+        self._module = module
+        self._connection_details = connection_details
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._max_idle = max_idle
+        self._validate = validate
+        self._validate_after = validate_after
+        
+    def _close(self, connection):
+        """
+        Closes a connection that will not be returned to the pool.
+        
+        :param connection: The connection to close.
+        """
+        try:
+            connection.close()
+        except Exception:
+            _logger.warning("Unable to close connection")
+            
+    def acquire(self):
+        """
+        Provides a live connection, reusing an idle one if possible.
+        
+        :return: The connection object to be used.
+        :except Exception: A problem occurred while connecting to the database.
+        """
+        while True:
+            try:
+                (connection, last_used) = self._idle.get_nowait()
+            except queue.Empty:
+                return self._module.connect(**self._connection_details)
+                
+            idle = time.monotonic() - last_used
+            if idle > self._max_idle:
+                self._close(connection)
+                continue
+            if self._validate and idle > self._validate_after:
+                try:
+                    self._validate(connection)
+                except Exception as e:
+                    _logger.debug("Discarding broken pooled connection: {}".format(e))
+                    self._close(connection)
+                    continue
+            return connection
+            
+    def release(self, connection):
+        """
+        Returns a healthy connection to the pool, closing it if the pool is
+        already full.
+        
+        Any open transaction is rolled back first, so the next user does not
+        see a stale snapshot and the server does not hold locks for an idle
+        session; a connection that cannot be rolled back is discarded.
+        
+        :param connection: The connection to return.
+        """
+        try:
+            connection.rollback()
+        except Exception as e:
+            _logger.debug("Discarding pooled connection that could not be rolled back: {}".format(e))
+            self._close(connection)
+            return
+            
+        try:
+            self._idle.put_nowait((connection, time.monotonic()))
+        except queue.Full:
+            self._close(connection)
+            
+    def discard(self, connection):
+        """
+        Closes a connection that is known to be broken.
+        
+        :param connection: The connection to discard.
+        """
+        self._close(connection)
+        
+    def clear(self):
+        """
+        Closes every idle connection.
+        """
+        while True:
+            try:
+                (connection, _) = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(connection)
+            
 class _SQLDatabase(CachingDatabase):
     """
     A stub documenting the features an _SQLDatabase object must provide.
@@ -57,6 +205,16 @@ class _SQLDatabase(CachingDatabase):
         """
         raise NotImplementedError("_getConnection must be overridden")
         
+    def _releaseConnection(self, connection, healthy):
+        """
+        Hands back a connection obtained from `_getConnection`.
+        
+        :param connection: The connection object that was used.
+        :param bool healthy: False if the connection raised a connection-level
+                             error and must not be reused.
+        """
+        raise NotImplementedError("_releaseConnection must be overridden")
+        
 class _DB20Broker(_SQLDatabase):
     """
     Defines bevahiour for a DB API 2.0-compatible broker.
@@ -64,48 +222,174 @@ class _DB20Broker(_SQLDatabase):
     _module = None #: The db2api-compliant module to use
     _connection_details = None #: The module-specific details needed to connect to a database
     _query_mac = None #: The string used to look up a MAC's binding
+    _batch_placeholder = '%s' #: The parameter-marker for the nth MAC in a batch, as a format-string
+    _batch_window = None #: The number of seconds to wait for concurrent lookups to join a batch
+    _batch_lock = None #: Guards `_batch_pending`
+    _batch_pending = None #: MACs -> _PendingLookups in the batch being gathered, or None
+    _batch_queries = None #: Batch-size -> query string, populated as sizes are seen
     
-    def _lookupMAC(self, mac):
-        mac = str(mac)
+    def __init__(self, concurrency_limit):
+        """
+        Sets up lookup-batching, if requested.
+        
+        :param int concurrency_limit: The number of concurrent database hits to
+                                      permit.
+        :except Exception: Cache-initialisation failed.
+        """
+        _SQLDatabase.__init__(self, concurrency_limit)
+        
+        if config.SQL_BATCH_WINDOW:
+            self._batch_window = config.SQL_BATCH_WINDOW
+            self._batch_lock = threading.Lock()
+            self._batch_queries = {}
+            
+    def _executeLookup(self, cursor, mac):
+        """
+        Runs `_query_mac` for `mac` on `cursor`.
+        
+        Backends that can keep a server-side prepared statement alive on a
+        pooled connection override this to avoid re-parsing the query.
+        
+        :param cursor: The cursor on which to execute the query.
+        :param str mac: The MAC to look up.
+        """
+        cursor.execute(self._query_mac, (mac,))
+        
+    def _query(self, execute):
+        """
+        Obtains a connection and cursor, handing the cursor to `execute` and
+        cleaning up afterwards.
+        
+        :param callable execute: Invoked with the cursor; its return value is
+                                 passed back to the caller.
+        :return: Whatever `execute` returned.
+        :except Exception: A problem occurred while accessing the database.
+        """
+        db = self._getConnection()
+        healthy = True
         try:
-            db = self._getConnection()
             cur = db.cursor()
+            try:
+                return execute(cur)
+            finally:
+                try:
+                    cur.close()
+                except Exception:
+                    _logger.warning("Unable to close cursor")
+        except (self._module.OperationalError, self._module.InterfaceError):
+            healthy = False
+            raise
+        finally:
+            self._releaseConnection(db, healthy)
             
+    def _buildDefinition(self, result):
+        """
+        Converts a row from `_query_mac` into a Definition.
+        
+        :param sequence result: The row's values.
+        :return: The corresponding :class:`Definition`.
+        """
+        return Definition(
+            ip=result[0], hostname=result[1],
+            gateways=result[2], subnet_mask=result[3], broadcast_address=result[4],
+            domain_name=result[5], domain_name_servers=result[6], ntp_servers=result[7],
+            lease_time=result[8], subnet=result[9], serial=result[10],
+            extra=(_extra and dict(zip(_extra, result[11:])) or None),
+        )
+        
+    def _lookupMAC(self, mac):
+        mac = str(mac)
+        def execute(cur):
             _logger.debug("Looking up MAC {}...".format(mac))
-            cur.execute(self._query_mac, (mac,))
-            result = cur.fetchone()
-            if result:
-                _logger.debug("Record found for MAC {}".format(mac))
-                return Definition(
-                    ip=result[0], hostname=result[1],
-                    gateways=result[2], subnet_mask=result[3], broadcast_address=result[4],
-                    domain_name=result[5], domain_name_servers=result[6], ntp_servers=result[7],
-                    lease_time=result[8], subnet=result[9], serial=result[10],
-                    extra=(_extra and dict(zip(_extra, result[11:])) or None),
+            self._executeLookup(cur, mac)
+            return cur.fetchone()
+        result = self._query(execute)
+        
+        if result:
+            _logger.debug("Record found for MAC {}".format(mac))
+            return self._buildDefinition(result)
+        _logger.debug("No record found for MAC {}".format(mac))
+        return None
+        
+    def _lookupMACs(self, macs):
+        """
+        Looks up a collection of MACs, using as few round-trips as possible.
+        
+        :param list macs: The MACs to look up, as strings.
+        :return dict: MACs -> Definitions, omitting any without a record.
+        :except Exception: A problem occurred while accessing the database.
+        """
+        if len(macs) == 1:
+            definition = self._lookupMAC(macs[0])
+            return definition and {macs[0]: definition} or {}
+            
+        definitions = {}
+        def execute(cur):
+            _logger.debug("Looking up {} MACs in one batch...".format(len(batch)))
+            query = self._batch_queries.get(len(batch))
+            if query is None:
+                query = self._batch_queries[len(batch)] = _QUERY_MAC_BATCH.format(
+                    macs=', '.join(self._batch_placeholder.format(i) for i in range(1, len(batch) + 1)),
                 )
-            _logger.debug("No record found for MAC {}".format(mac))
-            return None
-        finally:
-            try:
-                cur.close()
-            except Exception:
-                _logger.warning("Unable to close cursor")
-            try:
-                db.close()
-            except Exception:
-                _logger.warning("Unable to close connection")
+            cur.execute(query, batch)
+            for result in cur.fetchall():
+                #Mirror the single-lookup behaviour of taking the first match
+                if result[0] not in definitions:
+                    definitions[result[0]] = self._buildDefinition(result[1:])
+        for i in range(0, len(macs), _BATCH_LIMIT):
+            batch = macs[i:i + _BATCH_LIMIT]
+            self._query(execute)
+        return definitions
+        
+    def _fetchMAC(self, mac):
+        if not self._batch_window:
+            return _SQLDatabase._fetchMAC(self, mac)
+            
+        mac = str(mac)
+        with self._batch_lock:
+            pending = self._batch_pending
+            leader = pending is None
+            if leader:
+                pending = self._batch_pending = {}
+            lookup = pending.get(mac)
+            if lookup is None:
+                lookup = pending[mac] = _PendingLookup()
                 
+        if not leader:
+            lookup.event.wait()
+            if lookup.error is not None:
+                raise lookup.error
+            return lookup.result
+            
+        #Give concurrent cache-misses a moment to join, then close the batch
+        #so that anything arriving later starts gathering the next one
+        time.sleep(self._batch_window)
+        with self._batch_lock:
+            self._batch_pending = None
+            
+        try:
+            with self._resource_lock:
+                definitions = self._lookupMACs(list(pending))
+        except Exception as e:
+            for waiting in pending.values():
+                waiting.error = e
+                waiting.event.set()
+            raise
+        for (waiting_mac, waiting) in pending.items():
+            waiting.result = definitions.get(waiting_mac)
+            waiting.event.set()
+        return lookup.result
+        
 class _PoolingBroker(_DB20Broker):
     """
     Defines bevahiour for a connection-pooling-capable DB API 2.0-compatible
     broker.
     """
     _pool = None #: The database connection pool
-    _eventlet__db_pool = None #: A reference to the eventlet.db_pool module
     
     def __init__(self, concurrency_limit):
         """
-        Sets up connection-pooling, if it's supported by the environment.
+        Sets up connection-pooling, if requested.
         
         :param int concurrency_limit: The number of concurrent database hits to
                                       permit.
@@ -115,25 +399,43 @@ class _PoolingBroker(_DB20Broker):
 
         if config.USE_POOL:
             _logger.debug("Configuring connection-pooling...")
-            try:
-                import eventlet.db_pool
-                self._eventlet__db_pool = eventlet.db_pool
-            except ImportError:
-                _logger.warning("eventlet is not available; falling back to unpooled mode")
-                return
-            else:
-                self._pool = self._eventlet__db_pool.ConnectionPool(
-                    self._module,
-                    max_size=concurrency_limit, max_idle=30, max_age=600, connect_timeout=5,
-                    **self._connection_details
-                )
-                
+            self._pool = _ConnectionPool(
+                self._module, self._connection_details,
+                max_size=concurrency_limit, validate=self._validateConnection,
+            )
+            
+    def _validateConnection(self, connection):
+        """
+        Ensures that an idle pooled connection is still usable before it is
+        handed out; a no-op unless the backend offers a cheap liveness check.
+        
+        :param connection: The connection to test.
+        :except Exception: The connection is no longer usable.
+        """
+        
     def _getConnection(self):
         if self._pool is not None:
-            return self._eventlet__db_pool.PooledConnectionWrapper(self._pool.get(), self._pool)
+            return self._pool.acquire()
         else:
             return self._module.connect(**self._connection_details)
             
+    def _releaseConnection(self, connection, healthy):
+        if self._pool is not None:
+            if healthy:
+                self._pool.release(connection)
+            else:
+                self._pool.discard(connection)
+        else:
+            try:
+                connection.close()
+            except Exception:
+                _logger.warning("Unable to close connection")
+                
+    def reinitialise(self):
+        _DB20Broker.reinitialise(self)
+        if self._pool is not None:
+            self._pool.clear()
+            
 class _NonPoolingBroker(_DB20Broker):
     """
     Defines bevahiour for a non-connection-pooling-capable DB API 2.0-compatible
@@ -142,6 +444,12 @@ class _NonPoolingBroker(_DB20Broker):
     def _getConnection(self):
         return self._module.connect(**self._connection_details)
         
+    def _releaseConnection(self, connection, healthy):
+        try:
+            connection.close()
+        except Exception:
+            _logger.warning("Unable to close connection")
+            
 class MySQL(_PoolingBroker):
     """
     Implements a MySQL broker.
@@ -186,6 +494,9 @@ class MySQL(_PoolingBroker):
         
         _logger.debug("MySQL configured; connection-details: {}".format(self._connection_details))
         
+    def _validateConnection(self, connection):
+        connection.ping()
+        
 class PostgreSQL(_PoolingBroker):
     """
     Implements a PostgreSQL broker.
@@ -229,6 +540,11 @@ class PostgreSQL(_PoolingBroker):
         
         _logger.debug("PostgreSQL configured; connection-details: {}".format(self._connection_details))
         
+    def _executeLookup(self, cursor, mac):
+        #psycopg prepares the statement server-side once per connection, so
+        #pooled connections skip parsing and planning on subsequent lookups
+        cursor.execute(self._query_mac, (mac,), prepare=True)
+        
 class Oracle(_PoolingBroker):
     """
     Implements an Oracle broker.
@@ -250,6 +566,7 @@ class Oracle(_PoolingBroker):
         )) or ''),
         mac=(config.CASE_INSENSITIVE_MACS and 'LOWER(m.mac)' or 'm.mac'),
     )
+    _batch_placeholder = ':{}'
 
     def __init__(self):
         """
@@ -268,7 +585,7 @@ class Oracle(_PoolingBroker):
         
         _logger.debug("Oracle configured; connection-details: {}".format(self._connection_details))
 
-class SQLite(_NonPoolingBroker):
+class SQLite(_PoolingBroker):
     """
     Implements a SQLite broker.
     """
@@ -289,6 +606,7 @@ class SQLite(_NonPoolingBroker):
         )) or ''),
         mac=(config.CASE_INSENSITIVE_MACS and 'LOWER(m.mac)' or 'm.mac'),
     )
+    _batch_placeholder = '?'
     
     def __init__(self):
         """
@@ -299,8 +617,10 @@ class SQLite(_NonPoolingBroker):
         
         self._connection_details = {
             'database': config.SQLITE_FILE,
+            'check_same_thread': False, #Pooled connections are handed between worker threads
         }
         
-        _NonPoolingBroker.__init__(self, 1)
+        #SQLite serialises access anyway, so a single connection is all that's useful
+        _PoolingBroker.__init__(self, 1)
         
         _logger.debug("SQLite configured; connection-details: {}".format(self._connection_details))
@@ -24,9 +24,12 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 (C) Neil Tallim, 2021 <flan@uguu.ca>
 (C) Anthony Woods, 2013 <awoods@internap.com>
 """
+import collections
 import collections.abc
+import copy
 import logging
 import threading
+import time
 import traceback
 
 import libpydhcpserver.dhcp_types.conversion
@@ -34,6 +37,9 @@ from libpydhcpserver.dhcp_types.ipv4 import IPv4
 
 _logger = logging.getLogger('databases.generic')
 
+_RECENT_MAC_LIFETIME = 5.0 #: The number of seconds for which a worker thread reuses the last definition it served
+_UNKNOWN_MAC_LIMIT = 1024 #: The number of unknown MACs to remember, discarding the least recently seen first
+
 class Definition(object):
     """
     A definition of a "lease" from a database.
@@ -100,6 +106,23 @@ class Definition(object):
         self.ntp_servers = self._parse_addresses(ntp_servers, limit=3)
         self.extra = extra
 
+    def copy(self):
+        """
+        Produces an independent copy of this definition, so that it may be
+        modified by a caller without affecting any cached instance.
+
+        :return: The copied :class:`Definition`.
+        """
+        definition = copy.copy(self)
+        if self.gateways is not None:
+            definition.gateways = list(self.gateways)
+        if self.domain_name_servers is not None:
+            definition.domain_name_servers = list(self.domain_name_servers)
+        if self.ntp_servers is not None:
+            definition.ntp_servers = list(self.ntp_servers)
+        definition.extra = copy.copy(self.extra)
+        return definition
+
     def _parse_address(self, address):
         """
         Takes an input-value and produces an IPv4 address.
@@ -137,6 +160,17 @@ class Definition(object):
             return [self._parse_address(i) for i in addresses[:limit]] or None
         return None
 
+def _copy_definition(definition):
+    """
+    Copies a cached lookup-result before it is handed out.
+
+    :param definition: A :class:`Definition` or a collection of them.
+    :return: An independent :class:`Definition` or list of them.
+    """
+    if isinstance(definition, Definition):
+        return definition.copy()
+    return [d.copy() for d in definition]
+
 class Database(object):
     """
     A stub describing the features a Database object must provide.
@@ -166,6 +200,11 @@ class CachingDatabase(Database):
     """
     _resource_lock = None #: A lock used to prevent the database from being overwhelmed.
     _cache = None #: The caching structure to use, if caching is desired.
+    _recent = None #: Per-thread (generation, MAC, expiration, definition) of the last cache-served lookup.
+    _generation = 0 #: Incremented on reinitialisation, invalidating every thread's recent lookup.
+    _unknown_macs = None #: MACs (as integers) the database did not know -> the time at which to ask again.
+    _unknown_macs_lock = None #: Serialises updates to `_unknown_macs`.
+    _unknown_mac_lifetime = None #: The number of seconds for which an unknown MAC is remembered.
 
     def __init__(self, concurrency_limit=2147483647):
         """
@@ -177,11 +216,16 @@ class CachingDatabase(Database):
         :raise Exception: Cache-initialisation failed.
         """
         _logger.debug("Initialising database with a maximum of {} concurrent connections".format(concurrency_limit))
-        self._resource_lock = threading.BoundedSemaphore(concurrency_limit)
+        self._resource_lock = threading.Semaphore(concurrency_limit) #Only ever released by the holder, so bounds-checking is redundant
+        self._recent = threading.local()
+        self._unknown_macs = collections.OrderedDict()
+        self._unknown_macs_lock = threading.Lock()
         try:
             self._setupCache()
         except Exception:
             _logger.error("Cache initialisation failed:\n{}".format(traceback.format_exc()))
+        if not self._cache: #Nothing to consult, so go straight to the database
+            self.lookupMAC = self._fetchMAC
 
     def _setupCache(self):
         """
@@ -190,6 +234,7 @@ class CachingDatabase(Database):
         :except Exception: Cache-initialisation failed.
         """
         from .. import config
+        self._unknown_mac_lifetime = config.UNAUTHORIZED_CLIENT_TIMEOUT
         if config.USE_CACHE:
             from . import _caching
             if config.CACHING_MODEL == 'in-process':
@@ -201,17 +246,17 @@ class CachingDatabase(Database):
                             self._cache = disk_cache
                         else:
                             _logger.debug("Setting up memory-cache on top of persistent caching database")
-                            self._cache = _caching.MemoryCache('memory', chained_cache=disk_cache)
+                            self._cache = _caching.MemoryCache('memory', max_entries=config.CACHE_MAX_ENTRIES, chained_cache=disk_cache)
                     except Exception:
                         _logger.error("Unable to initialise disk-based caching:\n{}".format(traceback.format_exc()))
                         if config.DISK_CACHE_PERSISTENT and not config.DISK_CACHE:
                             _logger.warning("Persistent caching is not available")
-                            self._cache = _caching.MemoryCache('memory-nonpersist')
+                            self._cache = _caching.MemoryCache('memory-nonpersist', max_entries=config.CACHE_MAX_ENTRIES)
                         elif config.DISK_CACHE:
                             _logger.warning("Caching is disabled: memory-caching was not requested, so no fallback exists")
                 else:
                     _logger.debug("Setting up memory-cache")
-                    self._cache = _caching.MemoryCache('memory')
+                    self._cache = _caching.MemoryCache('memory', max_entries=config.CACHE_MAX_ENTRIES)
             elif config.CACHING_MODEL == 'memcached':
                 _logger.debug("Setting up memcached-cache")
                 self._cache = _caching.MemcachedCache('memcached',
@@ -230,29 +275,85 @@ class CachingDatabase(Database):
                 _logger.warning("DISK_CACHE was set, but USE_CACHE was not")
 
     def reinitialise(self):
-        if self._cache:
-            try:
-                self._cache.reinitialise()
-            except Exception:
-                _logger.error("Cache reinitialisation failed:\n{}".format(traceback.format_exc()))
+        self.flushCache()
 
-    def lookupMAC(self, mac):
-        if self._cache:
-            try:
-                definition = self._cache.lookupMAC(mac)
-            except Exception:
-                _logger.error("Cache lookup failed:\n{}".format(traceback.format_exc()))
-            else:
-                if definition:
-                    return definition
+    def flushCache(self, mac=None):
+        """
+        Discards cached knowledge, so the database is consulted afresh.
 
+        :param mac: The MAC whose definition should be forgotten; if None,
+                    everything cached is discarded.
+        """
+        #Every thread's recent lookup is invalidated, since other threads'
+        #state can't be reached directly; each holds only one entry anyway
+        self._generation += 1
+        if mac is None:
+            self._unknown_macs = collections.OrderedDict()
+            if self._cache:
+                try:
+                    self._cache.reinitialise()
+                except Exception:
+                    _logger.error("Cache reinitialisation failed:\n{}".format(traceback.format_exc()))
+        else:
+            with self._unknown_macs_lock:
+                self._unknown_macs.pop(int(mac), None)
+            if self._cache:
+                try:
+                    self._cache.invalidateMAC(mac)
+                except Exception:
+                    _logger.error("Cache invalidation failed:\n{}".format(traceback.format_exc()))
+
+    def _fetchMAC(self, mac):
+        """
+        Retrieves `mac` from the underlying database, honouring the
+        concurrency limit.
+
+        :param :class:`MAC <dhcp_types.mac.MAC>` mac: The MAC to look up.
+        :return: The associated :class:`Definition` or None.
+        :except Exception: A problem occurred while accessing the database.
+        """
         with self._resource_lock:
-            definition = self._lookupMAC(mac)
-        if definition and self._cache:
+            return self._lookupMAC(mac)
+
+    def lookupMAC(self, mac):
+        #Only reached if caching is enabled; otherwise, __init__() replaces
+        #this with _fetchMAC()
+
+        #Clients retransmit in bursts, and each worker tends to see the
+        #same MAC repeatedly, so check its last answer before the cache
+        recent = getattr(self._recent, 'lookup', None)
+        now = time.monotonic()
+        if recent and recent[0] == self._generation and recent[1] == int(mac) and recent[2] > now:
+            return _copy_definition(recent[3])
+
+        try:
+            definition = self._cache.lookupMAC(mac)
+        except Exception:
+            _logger.error("Cache lookup failed:\n{}".format(traceback.format_exc()))
+        else:
+            if definition:
+                self._recent.lookup = (self._generation, int(mac), now + _RECENT_MAC_LIFETIME, _copy_definition(definition))
+                return definition
+
+        #Unknown clients retry persistently, so don't keep asking about them
+        key = int(mac)
+        expiration = self._unknown_macs.get(key)
+        if expiration is not None and expiration > now:
+            return None
+
+        definition = self._fetchMAC(mac)
+        if definition:
             try:
                 self._cache.cacheMAC(mac, definition)
             except Exception:
                 _logger.error("Cache update failed:\n{}".format(traceback.format_exc()))
+        else:
+            unknown_macs = self._unknown_macs
+            with self._unknown_macs_lock:
+                unknown_macs[key] = now + self._unknown_mac_lifetime
+                unknown_macs.move_to_end(key)
+                if len(unknown_macs) > _UNKNOWN_MAC_LIMIT:
+                    unknown_macs.popitem(last=False)
         return definition
 
 class Null(Database):
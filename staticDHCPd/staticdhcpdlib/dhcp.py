@@ -33,6 +33,7 @@ from . import config
 from . import statistics
 
 import libpydhcpserver.dhcp
+from libpydhcpserver.dhcp_types import conversion
 from libpydhcpserver.dhcp_types.ipv4 import IPv4
 from libpydhcpserver.dhcp_types.mac import MAC
 
@@ -53,8 +54,64 @@ _PACKET_TYPE_REQUEST_SELECTING = 'REQUEST:SELECTING'
 #IP constants
 _IP_REJECTED = '<nil>'
 
+_DROPPED_PACKET_TYPES = {
+    'DHCP_DISCOVER': _PACKET_TYPE_DISCOVER,
+    'DHCP_REQUEST': _PACKET_TYPE_REQUEST,
+    'DHCP_DECLINE': _PACKET_TYPE_DECLINE,
+    'DHCP_RELEASE': _PACKET_TYPE_RELEASE,
+    'DHCP_INFORM': _PACKET_TYPE_INFORM,
+    'DHCP_LEASEQUERY': _PACKET_TYPE_LEASEQUERY,
+} #: Maps DHCP message-type names to the methods reported for packets discarded under load
+
+_SHUTDOWN_TIMEOUT = 10.0 #: The number of seconds to wait for in-flight requests at shutdown
+
 _logger = logging.getLogger('dhcp')
 
+_subnet_options = {} #: (subnet, serial) -> (details, options), holding the last-seen subnet-level fields and their serialised options
+
+def _getSubnetOptions(definition):
+    """
+    Provides the options derived from `definition`'s subnet-level fields,
+    serialising them only if they differ from what was last seen for its
+    subnet.
+
+    :param :class:`databases.generic.Definition` definition: The definition
+        being applied to a packet.
+    :return tuple: (option, bytes) pairs; the bytes are shared and must be
+        copied before being assigned to a packet.
+    """
+    details = (
+        definition.gateways, definition.subnet_mask, definition.broadcast_address,
+        definition.domain_name, definition.domain_name_servers, definition.ntp_servers,
+    )
+    subnet_id = (definition.subnet, definition.serial)
+    cached = _subnet_options.get(subnet_id)
+    if cached and cached[0] == details:
+        return cached[1]
+
+    options = []
+    #Default gateway, subnet mask, and broadcast address.
+    if definition.gateways:
+        options.append((3, conversion.ipsToList(definition.gateways)))
+    if definition.subnet_mask:
+        options.append((1, conversion.ipToList(definition.subnet_mask)))
+    if definition.broadcast_address:
+        options.append((28, conversion.ipToList(definition.broadcast_address)))
+
+    #Domain details.
+    if definition.domain_name:
+        options.append((15, conversion.strToList(definition.domain_name)))
+    if definition.domain_name_servers:
+        options.append((6, conversion.ipsToList(definition.domain_name_servers)))
+
+    #NTP servers.
+    if definition.ntp_servers:
+        options.append((42, conversion.ipsToList(definition.ntp_servers)))
+
+    options = tuple(options)
+    _subnet_options[subnet_id] = (details, options)
+    return options
+
 class _PacketWrapper(object):
     """
     Wraps a packet for the duration of a handler's operations, allowing for
@@ -270,25 +327,13 @@ class _PacketWrapper(object):
             self.packet.setOption('yiaddr', definition.ip)
             self.packet.setOption(51, definition.lease_time)
 
-        #Default gateway, subnet mask, and broadcast address.
-        if definition.gateways:
-            self.packet.setOption(3, definition.gateways)
-        if definition.subnet_mask:
-            self.packet.setOption(1, definition.subnet_mask)
-        if definition.broadcast_address:
-            self.packet.setOption(28, definition.broadcast_address)
-
-        #Domain details.
+        #Client-specific details.
         if definition.hostname:
             self.packet.setOption(12, definition.hostname)
-        if definition.domain_name:
-            self.packet.setOption(15, definition.domain_name)
-        if definition.domain_name_servers:
-            self.packet.setOption(6, definition.domain_name_servers)
 
-        #NTP servers.
-        if definition.ntp_servers:
-            self.packet.setOption(42, definition.ntp_servers)
+        #Everything else is common to the subnet.
+        for (option, value) in _getSubnetOptions(definition):
+            self.packet.setOption(option, list(value))
 
     def loadDHCPPacket(self, definition, inform=False):
         """
@@ -405,6 +450,8 @@ class _DHCPServer(libpydhcpserver.dhcp.DHCPServer):
             response_interface=response_interface,
             response_interface_qtags=response_interface_qtags,
             link_local_only=(not config.ALLOW_DHCP_RELAYS),
+            worker_count=config.DHCP_WORKER_THREADS,
+            queue_size=config.DHCP_QUEUE_SIZE,
         )
 
     @_dhcpHandler(_PACKET_TYPE_DECLINE)
@@ -766,6 +813,24 @@ class _DHCPServer(libpydhcpserver.dhcp.DHCPServer):
         if not self._logDHCPAccess(mac):
             raise _PacketSourceIgnored("MAC has been ignored for excessive activity")
 
+    def _handleProcessingError(self, packet, source_address, port):
+        _logger.critical("Unhandled exception while processing packet from {}:\n{}".format(
+            source_address, traceback.format_exc(),
+        ))
+
+    def _handlePacketDropped(self, packet, source_address, port):
+        dropped = self._countDroppedPacket()
+        if dropped:
+            _logger.warning("Unable to keep up with DHCP traffic; discarded {} packet(s) since the last report".format(dropped))
+        statistics.emit(statistics.Statistics(
+            source_address,
+            packet.getHardwareAddress(), None,
+            None, None,
+            _DROPPED_PACKET_TYPES.get(packet.getDHCPMessageTypeName()),
+            0.0, False,
+            port,
+        ))
+
     def getDatabase(self):
         """
         Returns the database this server is configured to use.
@@ -880,6 +945,16 @@ class DHCPService(threading.Thread):
         """
         self._dhcp_server.tick()
 
+    def stop(self):
+        """
+        Stops the DHCP server's worker threads, once every packet already
+        received has been answered or `_SHUTDOWN_TIMEOUT` has elapsed.
+        """
+        _logger.info("Waiting for DHCP workers to finish processing...")
+        busy = self._dhcp_server.shutdown(timeout=_SHUTDOWN_TIMEOUT)
+        if busy:
+            _logger.warning("Abandoning DHCP workers that did not finish in time: {}".format(', '.join(busy)))
+
 class _PacketRejection(Exception):
     """
     The base-class for indicating that a packet could not be processed.
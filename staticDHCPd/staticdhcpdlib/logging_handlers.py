@@ -24,7 +24,34 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 """
 import collections
 import logging
+import logging.handlers
+import time
 
+class Formatter(logging.Formatter):
+    """
+    A :class:`logging.Formatter` that renders each second's timestamp only
+    once, rather than converting and formatting the time for every record
+    passing through every handler.
+    """
+    _time_cache = (None, None) #: The second and date-format last rendered, with the rendering
+    
+    def formatTime(self, record, datefmt=None):
+        """
+        Renders the time at which `record` was created.
+        
+        :param record: A logging record.
+        :param str datefmt: The `strftime()` format to use, if not the default.
+        :return str: The rendered time.
+        """
+        key = (int(record.created), datefmt)
+        (cached_key, rendered) = self._time_cache
+        if cached_key != key:
+            rendered = time.strftime(datefmt or self.default_time_format, self.converter(key[0]))
+            self._time_cache = (key, rendered) #Rebound whole, so readers never see a torn pair
+        if datefmt:
+            return rendered
+        return self.default_msec_format % (rendered, record.msecs)
+        
 class FIFOHandler(logging.Handler):
     """
     A handler that holds a fixed number of records, with FIFO behaviour.
@@ -42,13 +69,15 @@ class FIFOHandler(logging.Handler):
         """
         Called by the logging subsystem whenever new data is received.
         
+        `handle()` already holds the handler's lock, and the bounded deque
+        discards the oldest record itself, so this is a single O(1) insert.
+        
+        Only the severity and rendered line are kept, rather than the record,
+        so the buffer doesn't pin each record's arguments and attributes.
+        
         :param record: A logging record.
         """
-        self.acquire()
-        try:
-            self._records.appendleft(record)
-        finally:
-            self.release()
+        self._records.appendleft((record.levelno, self.format(record)))
             
     def flush(self):
         """
@@ -71,11 +100,160 @@ class FIFOHandler(logging.Handler):
         """
         Produces the current log.
         
-        :return list(str): The logged records, in human-readable form.
+        :return tuple: The logged records, as (severity, line) pairs.
+        """
+        #Copying the deque happens in a single step under the GIL, so the
+        #snapshot is consistent without blocking writers
+        return tuple(self._records)
+            
+
+class _DeferredFlushMixin(object):
+    """
+    Suppresses the flush that stream-based handlers perform after every
+    record, leaving it to `flushBuffer()`, so that a burst of records reaches
+    the file in as few writes as the stream's buffer allows.
+    """
+    def flush(self):
+        """
+        Does nothing; see `flushBuffer()`.
+        """
+        
+    def flushBuffer(self):
+        """
+        Writes out everything emitted since the last call.
+        """
+        super().flush()
+        
+class BufferedFileHandler(_DeferredFlushMixin, logging.FileHandler):
+    """
+    A :class:`logging.FileHandler` that flushes only on request.
+    """
+    
+class BufferedTimedRotatingFileHandler(_DeferredFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    """
+    A :class:`logging.handlers.TimedRotatingFileHandler` that flushes only on
+    request.
+    """
+    
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    A :class:`logging.handlers.QueueListener` that flushes its handlers only
+    once the queue has been drained, rather than after every record.
+    """
+    def handle(self, record):
+        """
+        Passes `record` to every handler, flushing any that buffer output if
+        nothing else is waiting.
+        
+        :param record: A logging record.
+        """
+        logging.handlers.QueueListener.handle(self, record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                flushBuffer = getattr(handler, 'flushBuffer', None)
+                if flushBuffer:
+                    flushBuffer()
+                    
+class PersistentSMTPHandler(logging.handlers.SMTPHandler):
+    """
+    A :class:`logging.handlers.SMTPHandler` that keeps its session with the
+    server open between messages, rather than connecting and authenticating
+    for every one; the session is checked with NOOP before being reused and
+    re-established if the server has dropped it.
+    """
+    _smtp = None #: The open session, if any
+    _date_cache = (None, None) #: The second last rendered as a Date header, with the rendering
+    
+    def _connect(self):
+        """
+        Opens and, if credentials were given, authenticates a new session.
+        
+        :return: The :class:`smtplib.SMTP` session.
+        :except Exception: The session could not be established.
+        """
+        import smtplib
+        smtp = smtplib.SMTP(self.mailhost, self.mailport or smtplib.SMTP_PORT, timeout=self.timeout)
+        try:
+            if self.username:
+                if self.secure is not None:
+                    smtp.ehlo()
+                    smtp.starttls(*self.secure)
+                    smtp.ehlo()
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+        
+    def _disconnect(self):
+        """
+        Ends the current session, if any.
+        """
+        smtp = self._smtp
+        self._smtp = None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except Exception:
+                smtp.close()
+                
+    def _getSession(self):
+        """
+        Provides a live session, reusing the current one if it still responds.
+        
+        :return: The :class:`smtplib.SMTP` session.
+        :except Exception: A session could not be established.
+        """
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except Exception:
+                pass
+            self._disconnect()
+        self._smtp = self._connect()
+        return self._smtp
+        
+    def emit(self, record):
+        """
+        Sends `record` as an e-mail.
+        
+        :param record: A logging record.
+        """
+        try:
+            import email.message
+            import email.utils
+            import smtplib
+            
+            message = email.message.EmailMessage()
+            message['From'] = self.fromaddr
+            message['To'] = ','.join(self.toaddrs)
+            message['Subject'] = self.getSubject(record)
+            second = int(record.created)
+            (cached_second, date) = self._date_cache
+            if cached_second != second: #A storm of alerts shares one rendering
+                date = email.utils.formatdate(second, localtime=True)
+                self._date_cache = (second, date)
+            message['Date'] = date
+            message.set_content(self.format(record))
+            
+            try:
+                self._getSession().send_message(message)
+            except (smtplib.SMTPServerDisconnected, OSError): #Dropped between NOOP and sending
+                self._disconnect()
+                self._getSession().send_message(message)
+        except Exception:
+            self._disconnect()
+            self.handleError(record)
+            
+    def close(self):
+        """
+        Ends the session along with the handler.
         """
         self.acquire()
         try:
-            return [(record.levelno, self.format(record)) for record in self._records]
+            self._disconnect()
         finally:
             self.release()
-            
+        logging.handlers.SMTPHandler.close(self)
+        
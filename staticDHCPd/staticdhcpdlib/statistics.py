@@ -84,8 +84,8 @@ Statistics associated with a DHCP event.
 .. py:attribute:: processed
     :noindex:
 
-    Whether the packet was fully processed (``False`` if non-DHCP or
-    blocklisted).
+    Whether the packet was fully processed (``False`` if non-DHCP,
+    blocklisted, or discarded because the server was overloaded).
 
 .. py:attribute:: port
     :noindex:
@@ -55,9 +55,9 @@ class Logger(object):
         self._handler = logging_handlers.FIFOHandler(config.WEB_LOG_HISTORY)
         self._handler.setLevel(getattr(logging, config.WEB_LOG_SEVERITY))
         if config.DEBUG:
-            self._handler.setFormatter(logging.Formatter("%(asctime)s : %(levelname)s : %(name)s : %(message)s"))
+            self._handler.setFormatter(logging_handlers.Formatter("%(asctime)s : %(levelname)s : %(name)s : %(message)s"))
         else:
-            self._handler.setFormatter(logging.Formatter("%(asctime)s : %(message)s"))
+            self._handler.setFormatter(logging_handlers.Formatter("%(asctime)s : %(message)s"))
         _logger.root.addHandler(self._handler)
         _logger.info("Web-accessible logging online; buffer-size={}".format(config.WEB_LOG_HISTORY))
         
@@ -69,10 +69,13 @@ class Logger(object):
         """
         max_height = config.WEB_LOG_MAX_HEIGHT and 'max-height:{}px;'.format(config.WEB_LOG_MAX_HEIGHT)
         
-        global _SEVERITY_MAP
-        output = []
-        for (severity, line) in self._handler.readContents():
-            output.append('<span class="{}">{}</span>'.format(_SEVERITY_MAP[severity], functions.sanitise(line).replace('\n', '<br/>')))
+        render_line = '<span class="{}">{}</span>'.format
+        sanitise = functions.sanitise
+        severity_map = _SEVERITY_MAP
+        output = [
+            render_line(severity_map[severity], sanitise(line).replace('\n', '<br/>'))
+            for (severity, line) in self._handler.readContents()
+        ]
         return "<div style='overflow-y:auto;{}'>{}</div>".format(max_height, '<br/>\n'.join(output))
         
 def reinitialise(*args, **kwargs):